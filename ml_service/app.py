@@ -4,17 +4,26 @@ Provides REST API for question analysis.
 Runs on port 5001.
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
 from flask_cors import CORS
+import hmac
 import logging
+import os
+import threading
 import traceback
 import sys
 from pathlib import Path
 
+import orjson
+
 # Add parent directory to path so we can import ml_service modules
 sys.path.insert(0, str(Path(__file__).parent))
 
-from inference import get_analyzer_service
+from inference import RESULT_CACHE_TTL, get_analyzer_service
+from features import get_sbert_model
+from cache import LRUCache
+from batching import DynamicBatcher
+import mlpool
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -24,30 +33,120 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
-# Load analyzer service lazily
+def _dumps(obj) -> bytes:
+    """Serialize to JSON bytes with orjson (NumPy scalars/arrays supported natively)."""
+    return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+
+def ojsonify(obj, status: int = 200) -> Response:
+    """Drop-in for flask.jsonify backed by orjson."""
+    return Response(_dumps(obj), status=status, mimetype='application/json')
+
 analyzer = None
+_analyzer_lock = threading.Lock()
 
 def get_analyzer():
-    """Get analyzer, initializing on first use."""
+    """Get analyzer, initializing it if it has not been loaded yet."""
     global analyzer
     if analyzer is None:
-        analyzer = get_analyzer_service()
-        if analyzer and analyzer.models_loaded:
-            logger.info("✅ ML models loaded successfully")
-        else:
-            logger.warning("⚠️  WARNING: ML models not loaded. Training required.")
-            logger.warning("   Run: python models.py training_data.csv")
+        with _analyzer_lock:
+            if analyzer is None:
+                service = get_analyzer_service()
+                if service and service.models_loaded:
+                    logger.info("✅ ML models loaded successfully")
+                else:
+                    logger.warning("⚠️  WARNING: ML models not loaded. Training required.")
+                    logger.warning("   Run: python models.py training_data.csv")
+                analyzer = service
     return analyzer
 
+def _warm_models():
+    """Load the analyzer and SBERT without blocking the caller; /ready flips once done."""
+    def warm():
+        try:
+            get_analyzer()
+            get_sbert_model()
+        except Exception:
+            logger.error(f"Background model load failed:\n{traceback.format_exc()}")
+    
+    threading.Thread(target=warm, name='model-warmup', daemon=True).start()
+
+def _after_fork_in_child():
+    # A fork can land mid-load: give the child a fresh lock and its own warm-up thread
+    global _analyzer_lock
+    _analyzer_lock = threading.Lock()
+    if analyzer is None:
+        _warm_models()
+
+# Serialized analysis responses keyed by (stripped question text, explain_detailed).
+# This cache answers before the analyzer's own, so it expires entries on the same TTL.
+RESPONSE_CACHE_SIZE = 8192
+response_cache = LRUCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+
+def _cache_response(question: str, explain_detailed: bool, result: dict) -> tuple:
+    """Serialize an analysis result once and store it for repeat questions."""
+    cached = (_dumps(result), bool(result.get('success')))
+    response_cache.put((question, explain_detailed), cached)
+    return cached
+
+# Cache misses from /analyze and /analyze-batch are queued on one batcher thread and
+# coalesced into analyze_many calls (one SBERT pass, one predict per model, repeats
+# analyzed once), so all in-process inference runs on that thread
+REQUEST_BATCH_SIZE = 32
+REQUEST_MAX_LATENCY_MS = 5
+
+def _analyze_requests(items: list) -> list:
+    """Analyze queued (question, explain_detailed) requests, one analyze_many call per setting."""
+    results = [None] * len(items)
+    for explain_detailed in (False, True):
+        indices = [i for i, (_, detailed) in enumerate(items) if detailed == explain_detailed]
+        if indices:
+            questions = [items[i][0] for i in indices]
+            for i, result in zip(indices, mlpool.analyze_many(questions, explain_detailed=explain_detailed)):
+                results[i] = result
+    return results
+
+request_batcher = DynamicBatcher(
+    _analyze_requests,
+    max_batch_size=REQUEST_BATCH_SIZE,
+    max_latency_ms=REQUEST_MAX_LATENCY_MS,
+    name='request-batcher',
+    # A hung or dead pool would otherwise be retried once per queued question,
+    # POOL_TIMEOUT each, while every other request waits behind it
+    fail_fast=(mlpool.PoolError,),
+)
+
+def _cached_analyze(question: str, explain_detailed: bool = False) -> tuple:
+    """Return (response_json, success) for a question, analyzing it on a cache miss."""
+    cached = response_cache.get((question, explain_detailed))
+    if cached is None:
+        result = request_batcher((question, explain_detailed))
+        cached = _cache_response(question, explain_detailed, result)
+    return cached
+
+# Load the models at import so the first request is as fast as the rest; under
+# gunicorn --preload workers fork warm. With PRELOAD_MODELS=0 they load in a
+# background thread instead and /ready reports 503 until they are in memory.
+if os.environ.get('PRELOAD_MODELS', '1') == '1':
+    get_analyzer()
+    get_sbert_model()
+else:
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+    _warm_models()
+
 @app.route('/health', methods=['GET'])
 def health():
-    """Health check endpoint."""
-    analyzer = get_analyzer()
-    return jsonify({
-        'status': 'ok',
+    """Liveness check: the process is up. Never touches the models."""
+    return ojsonify({'status': 'ok', 'service': 'ML Question Analyzer'}, 200)
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness check: 200 once the models are loaded, 503 while loading or untrained."""
+    models_loaded = bool(analyzer and analyzer.models_loaded)
+    return ojsonify({
+        'status': 'ok' if models_loaded else 'not_ready',
         'service': 'ML Question Analyzer',
-        'models_loaded': analyzer.models_loaded if analyzer else False,
-    }), 200
+        'models_loaded': models_loaded,
+    }, 200 if models_loaded else 503)
 
 @app.route('/analyze', methods=['POST'])
 def analyze():
@@ -56,7 +155,8 @@ def analyze():
     
     Request body:
     {
-        "question": "What is photosynthesis?"
+        "question": "What is photosynthesis?",
+        "explain_detailed": false    (optional: per-question SHAP feature importance)
     }
     
     Response:
@@ -77,40 +177,47 @@ def analyze():
         data = request.get_json()
         
         if not data or 'question' not in data:
-            return jsonify({
+            return ojsonify({
                 'success': False,
                 'error': 'Missing required field: question'
-            }), 400
+            }, 400)
         
         question = data['question'].strip()
         
         if len(question) < 3:
-            return jsonify({
+            return ojsonify({
                 'success': False,
                 'error': 'Question must be at least 3 characters long'
-            }), 400
+            }, 400)
+        
+        explain_detailed = data.get('explain_detailed', False)
+        if not isinstance(explain_detailed, bool):
+            return ojsonify({
+                'success': False,
+                'error': 'explain_detailed must be true or false'
+            }, 400)
         
         analyzer = get_analyzer()
         if not analyzer or not analyzer.models_loaded:
             logger.warning("Models not loaded, returning error")
-            return jsonify({
+            return ojsonify({
                 'success': False,
                 'error': 'ML models not loaded. Please train models first: python models.py training_data.csv',
                 'question': question,
-            }), 503
+            }, 503)
         
-        result = analyzer.analyze(question)
+        body, success = _cached_analyze(question, explain_detailed)
         
-        return jsonify(result), 200 if result.get('success') else 400
+        return Response(body, status=200 if success else 400, mimetype='application/json')
     
     except Exception as e:
         logger.error(f"Error analyzing question: {str(e)}")
         logger.error(traceback.format_exc())
         
-        return jsonify({
+        return ojsonify({
             'success': False,
             'error': f'Internal server error: {str(e)}'
-        }), 500
+        }, 500)
 
 @app.route('/analyze-batch', methods=['POST'])
 def analyze_batch():
@@ -122,7 +229,8 @@ def analyze_batch():
         "questions": [
             "What is photosynthesis?",
             "Explain evolution."
-        ]
+        ],
+        "explain_detailed": false    (optional: per-question SHAP feature importance)
     }
     
     Response:
@@ -135,86 +243,130 @@ def analyze_batch():
         data = request.get_json()
         
         if not data or 'questions' not in data:
-            return jsonify({
+            return ojsonify({
                 'success': False,
                 'error': 'Missing required field: questions'
-            }), 400
+            }, 400)
         
         questions = data['questions']
         
         if not isinstance(questions, list):
-            return jsonify({
+            return ojsonify({
                 'success': False,
                 'error': 'questions must be a list'
-            }), 400
+            }, 400)
         
         if len(questions) > 100:
-            return jsonify({
+            return ojsonify({
                 'success': False,
                 'error': 'Maximum 100 questions per request'
-            }), 400
+            }, 400)
         
-        analyzer = get_analyzer()
-        results = []
-        for question in questions:
-            if not isinstance(question, str):
-                results.append({'success': False, 'error': 'Invalid question format'})
-                continue
-            
-            result = analyzer.analyze(question) if analyzer and analyzer.models_loaded else {
+        explain_detailed = data.get('explain_detailed', False)
+        if not isinstance(explain_detailed, bool):
+            return ojsonify({
                 'success': False,
-                'error': 'ML models not loaded'
-            }
-            results.append(result)
-        
-        return jsonify({
-            'success': True,
-            'count': len(results),
-            'results': results
-        }), 200
+                'error': 'explain_detailed must be true or false'
+            }, 400)
+        
+        analyzer = get_analyzer()
+        models_loaded = bool(analyzer and analyzer.models_loaded)
+        
+        # Deduplicate and serve repeats from the cache
+        keys = [q.strip() if isinstance(q, str) else None for q in questions]
+        responses = {}
+        missing = []
+        if models_loaded:
+            for question in dict.fromkeys(k for k in keys if k is not None):
+                cached = response_cache.get((question, explain_detailed))
+                if cached is None:
+                    missing.append(question)
+                else:
+                    responses[question] = cached
+        
+        # Queue every uncached question on the request batcher, which analyzes them
+        # (with any concurrent requests) in batches of up to REQUEST_BATCH_SIZE
+        pending = [request_batcher.submit((question, explain_detailed)) for question in missing]
+        for question, future in zip(missing, pending):
+            responses[question] = _cache_response(question, explain_detailed, future.result())
+        
+        invalid = _dumps({'success': False, 'error': 'Invalid question format'})
+        not_loaded = _dumps({'success': False, 'error': 'ML models not loaded'})
+        results = [
+            invalid if key is None else responses[key][0] if models_loaded else not_loaded
+            for key in keys
+        ]
+        
+        # Cached results are already serialized, so splice them into the envelope
+        body = b'{"success":true,"count":%d,"results":[%s]}' % (len(results), b','.join(results))
+        return Response(body, status=200, mimetype='application/json')
     
     except Exception as e:
         logger.error(f"Error in batch analysis: {str(e)}")
         logger.error(traceback.format_exc())
         
-        return jsonify({
+        return ojsonify({
             'success': False,
             'error': f'Internal server error: {str(e)}'
-        }), 500
+        }, 500)
 
 @app.route('/models/status', methods=['GET'])
 def model_status():
     """Get status of loaded models."""
     if not analyzer:
-        return jsonify({
+        return ojsonify({
             'status': 'not_initialized',
             'message': 'Analyzer service not initialized'
-        }), 503
+        }, 503)
     
-    return jsonify({
+    return ojsonify({
         'status': 'ok' if analyzer.models_loaded else 'not_loaded',
         'models_loaded': analyzer.models_loaded,
-        'message': 'Models loaded successfully' if analyzer.models_loaded else 'Models need to be trained. Run: python models.py training_data.csv'
-    }), 200
+        'message': 'Models loaded successfully' if analyzer.models_loaded else 'Models need to be trained. Run: python models.py training_data.csv',
+        'cache': response_cache.stats(),
+    }, 200)
+
+# POST /cache/clear requires `Authorization: Bearer <CACHE_CLEAR_TOKEN>`; with the
+# variable unset the endpoint is disabled and answers 404
+CACHE_CLEAR_TOKEN = os.environ.get('CACHE_CLEAR_TOKEN', '')
+
+@app.route('/cache/clear', methods=['POST'])
+def clear_cache():
+    """
+    Drop all cached analysis responses in this process (admin only, see CACHE_CLEAR_TOKEN).
+    
+    Clears the app's response cache and the analyzer's result cache. The result
+    caches inside ML_POOL_WORKERS worker processes are not reached and expire on
+    their TTL.
+    """
+    if not CACHE_CLEAR_TOKEN:
+        return ojsonify({'success': False, 'error': 'Endpoint not found'}, 404)
+    
+    expected = f'Bearer {CACHE_CLEAR_TOKEN}'.encode()
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected):
+        return ojsonify({'success': False, 'error': 'Unauthorized'}, 401)
+    
+    cleared = response_cache.clear()
+    if analyzer:
+        analyzer.cache_clear()
+    logger.info(f"Cleared {cleared} cached responses")
+    return ojsonify({'success': True, 'cleared': cleared}, 200)
 
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({'success': False, 'error': 'Endpoint not found'}), 404
+    return ojsonify({'success': False, 'error': 'Endpoint not found'}, 404)
 
 @app.errorhandler(405)
 def method_not_allowed(error):
-    return jsonify({'success': False, 'error': 'Method not allowed'}), 405
+    return ojsonify({'success': False, 'error': 'Method not allowed'}, 405)
 
 @app.errorhandler(500)
 def internal_error(error):
     logger.error(f"Internal error: {str(error)}")
-    return jsonify({'success': False, 'error': 'Internal server error'}), 500
+    return ojsonify({'success': False, 'error': 'Internal server error'}, 500)
 
 if __name__ == '__main__':
-    # Initialize analyzer so health endpoint reflects model state at startup
-    get_analyzer()
-    
     logger.info("\n" + "="*60)
     logger.info("🚀 Starting ML Question Analyzer Service...")
     logger.info("="*60)
@@ -222,8 +374,10 @@ if __name__ == '__main__':
     logger.info("\n📊 Endpoints:")
     logger.info("  POST /analyze - Analyze a single question")
     logger.info("  POST /analyze-batch - Analyze multiple questions")
-    logger.info("  GET /health - Health check")
+    logger.info("  GET /health - Liveness check")
+    logger.info("  GET /ready - Readiness check (models loaded)")
     logger.info("  GET /models/status - Model status")
+    logger.info("  POST /cache/clear - Clear cached analysis results (needs CACHE_CLEAR_TOKEN)")
     logger.info("="*60 + "\n")
     
     app.run(host='127.0.0.1', port=5001, debug=False, use_reloader=False)
@@ -0,0 +1,111 @@
+"""
+Dynamic Batching Module
+Coalesces concurrent single-item calls into one batched call.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Sequence, Tuple, Type
+
+
+class DynamicBatcher:
+    """
+    Collect items submitted from many threads and run them through one batched function.
+
+    A single background thread drains the queue: it waits for the first item, then keeps
+    collecting until `max_batch_size` items are queued or `max_latency_ms` has elapsed,
+    calls `batch_fn(items)` once and scatters the results back to each caller's future.
+    If the batched call raises, each item is retried alone, so only the callers whose
+    item fails see the exception. Exceptions listed in `fail_fast` (e.g. a backend
+    timeout, where retrying item by item would stall the queue once per item) fail
+    the whole batch at once instead.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = 32, max_latency_ms: float = 10.0,
+                 name: str = 'dynamic-batcher',
+                 fail_fast: Tuple[Type[BaseException], ...] = ()):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self.name = name
+        self.fail_fast = fail_fast
+
+        self._lock = threading.Lock()
+        self._queue = None
+        self._worker = None
+        self._worker_pid = None
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item and return a future resolving to its result."""
+        future = Future()
+        self._ensure_worker().put((item, future))
+        return future
+
+    def __call__(self, item: Any) -> Any:
+        """Queue an item and block until its result is ready."""
+        return self.submit(item).result()
+
+    def _ensure_worker(self) -> queue.Queue:
+        # Threads do not survive fork (e.g. gunicorn --preload), so the worker
+        # is started lazily and restarted in every process that uses it.
+        pid = os.getpid()
+        if self._worker_pid != pid or not self._worker.is_alive():
+            with self._lock:
+                if self._worker_pid != pid or not self._worker.is_alive():
+                    self._queue = queue.Queue()
+                    self._worker = threading.Thread(
+                        target=self._run, args=(self._queue,), name=self.name, daemon=True
+                    )
+                    self._worker.start()
+                    self._worker_pid = pid
+        return self._queue
+
+    def _run(self, q: queue.Queue):
+        while True:
+            batch = [q.get()]
+            deadline = time.monotonic() + self.max_latency
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._process(batch)
+
+    def _process(self, batch: List[tuple]):
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        try:
+            results = self.batch_fn([item for item, _ in batch])
+        except Exception as e:
+            if len(batch) == 1 or isinstance(e, self.fail_fast):
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+            # One bad item must not fail everyone queued with it: retry each on its own,
+            # unless the retry hits a fail_fast error, which fails the rest at once
+            for i, (item, future) in enumerate(batch):
+                try:
+                    result, = self.batch_fn([item])
+                except self.fail_fast as item_error:
+                    for _, rest in batch[i:]:
+                        rest.set_exception(item_error)
+                    return
+                except Exception as item_error:
+                    future.set_exception(item_error)
+                else:
+                    future.set_result(result)
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
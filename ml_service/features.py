@@ -3,28 +3,212 @@ Feature Engineering Module
 Extracts linguistic, readability, cognitive, and semantic features from questions.
 """
 
+import importlib.util
+import multiprocessing
+import os
 import re
 import math
+import string
+import threading
 import numpy as np
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
 from typing import Dict, List, Tuple
-from sentence_transformers import SentenceTransformer
 
-# Initialize SBERT model (runs once on import)
+# sentence_transformers / onnxruntime / transformers pull in torch and friends, so
+# they are imported only when the SBERT model is first loaded; modules that only
+# need the text features (e.g. flags.py) never pay for them
+HAS_ONNXRUNTIME = all(
+    importlib.util.find_spec(name) is not None for name in ('onnxruntime', 'transformers')
+)
+
+# Precompiled patterns shared by the extractors below
+SENTENCE_SPLIT_RE = re.compile(r'[.!?]+')
+WORD_RE = re.compile(r'\w+')
+NONWORD_RE = re.compile(r'[^\w]')
+
+# Literal word lists, matched by set membership against \w+ tokens
+# (equivalent to a \bword\b regex alternation, without the regex scan per word)
+CLAUSE_WORDS = frozenset({'and', 'or', 'but', 'which', 'that'})
+PASSIVE_WORDS = frozenset({'was', 'were', 'been', 'by'})
+NEGATION_WORDS = frozenset({'not', 'no', 'never', 'neither', 'nor', 'without'})
+
+# Byte lookup table for vectorized syllable counting
+VOWEL_BYTES = np.frombuffer(b'aeiouy', dtype=np.uint8)
+_IS_VOWEL_BYTE = np.zeros(256, dtype=bool)
+_IS_VOWEL_BYTE[VOWEL_BYTES] = True
+
+# bytes.translate table keeping vowels and blanking every other byte, so each
+# vowel group becomes one whitespace-separated token
+_VOWEL_GROUP_TBL = bytes(b if _IS_VOWEL_BYTE[b] else ord(' ') for b in range(256))
+
+# Below this many words NumPy's per-call overhead outweighs the vectorized loop
+SYLLABLE_BATCH_MIN_WORDS = 64
+
+# SBERT model, loaded once per process on first use by get_sbert_model()
 SBERT_MODEL = None
+_SBERT_LOCK = threading.Lock()
+SBERT_MODEL_NAME = 'all-MiniLM-L6-v2'
+# Questions are short, so truncating at 64 tokens avoids padding batches out to 256
+SBERT_MAX_SEQ_LENGTH = 64
+
+# Optional int8-quantized ONNX export of the SBERT model, created once with:
+#   optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2 models/sbert_onnx
+#   optimum-cli onnxruntime quantize --avx512 --onnx_model models/sbert_onnx --output models/sbert_onnx_int8
+SBERT_ONNX_DIR = Path(__file__).parent / 'models' / 'sbert_onnx_int8'
+SBERT_ONNX_MODEL_PATH = SBERT_ONNX_DIR / 'model_quantized.onnx'
+
+
+class OnnxSentenceEncoder:
+    """
+    ONNX Runtime replacement for SentenceTransformer.encode.
+    Runs the int8-quantized MiniLM graph, then mean-pools and L2-normalizes the
+    token embeddings in NumPy, mirroring the all-MiniLM-L6-v2 pipeline.
+    """
+    
+    def __init__(self, model_path: Path = SBERT_ONNX_MODEL_PATH):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # intra_op_num_threads defaults to 0, i.e. one thread per physical core
+        self.session = ort.InferenceSession(
+            str(model_path), options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        
+        # `optimum-cli export` saves the tokenizer next to the model; quantize may not
+        tokenizer_dir = model_path.parent
+        if not (tokenizer_dir / 'tokenizer.json').exists():
+            tokenizer_dir = f'sentence-transformers/{SBERT_MODEL_NAME}'
+        self.tokenizer = AutoTokenizer.from_pretrained(str(tokenizer_dir))
+    
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, show_progress_bar: bool = False) -> np.ndarray:
+        """Encode one text or a list of texts. Embeddings are always L2-normalized."""
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        
+        # Batch texts of similar length together so each batch pads as little as possible
+        order = np.argsort([len(s) for s in sentences], kind='stable')
+        sorted_sentences = [sentences[i] for i in order]
+        
+        batches = []
+        for start in range(0, len(sorted_sentences), batch_size):
+            tokens = self.tokenizer(
+                sorted_sentences[start:start + batch_size],
+                padding=True, truncation=True, max_length=SBERT_MAX_SEQ_LENGTH,
+                return_tensors='np',
+            )
+            feeds = {name: tokens[name].astype(np.int64) for name in self.input_names}
+            token_embeddings = self.session.run(None, feeds)[0]
+            
+            # Mean pooling over non-padding tokens
+            mask = tokens['attention_mask'][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            batches.append(pooled)
+        
+        if not batches:
+            return np.zeros((0, 384), dtype=np.float32)
+        
+        embeddings = np.empty((len(sentences), batches[0].shape[1]), dtype=np.float32)
+        embeddings[order] = np.concatenate(batches)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings[0] if single else embeddings
+
 
 def get_sbert_model():
-    """Lazy load SBERT model"""
+    """
+    Lazy load SBERT model, preferring the int8 ONNX export when present.
+    Concurrent first calls load it once; a model loaded before a fork (gunicorn
+    --preload) is reused by the children, sharing its pages copy-on-write.
+    """
     global SBERT_MODEL
     if SBERT_MODEL is None:
-        SBERT_MODEL = SentenceTransformer('all-MiniLM-L6-v2')
+        with _SBERT_LOCK:
+            if SBERT_MODEL is None:
+                if HAS_ONNXRUNTIME and SBERT_ONNX_MODEL_PATH.exists():
+                    model = OnnxSentenceEncoder(SBERT_ONNX_MODEL_PATH)
+                else:
+                    from sentence_transformers import SentenceTransformer
+                    
+                    # SentenceTransformer.encode already sorts each call by text length
+                    model = SentenceTransformer(SBERT_MODEL_NAME)
+                    model.max_seq_length = SBERT_MAX_SEQ_LENGTH
+                SBERT_MODEL = model
     return SBERT_MODEL
 
 
+def _reset_locks_after_fork():
+    # A fork can land mid-load, leaving a lock held forever in the child
+    global _SBERT_LOCK, _ENCODE_EXECUTOR_LOCK
+    _SBERT_LOCK = threading.Lock()
+    _ENCODE_EXECUTOR_LOCK = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_locks_after_fork)
+
+
+# ============================================================================
+# 0. SHARED TEXT STATISTICS
+# ============================================================================
+
+@dataclass
+class TextStats:
+    """
+    Tokenization shared by the linguistic, readability, and Bloom extractors.
+    Computed once per text so words, sentences, and syllables are not re-derived
+    by every metric.
+    """
+    words: List[str]
+    lower_text: str
+    words_lower: List[str]  # lowercased \w+ tokens, punctuation stripped
+    sentence_count: int
+    syllables_per_word: np.ndarray
+    syllable_count: int
+    polysyllable_count: int  # words with 3+ syllables (complex words)
+
+    @property
+    def word_count(self) -> int:
+        return len(self.words)
+
+
+def _extract_text_stats(text: str) -> TextStats:
+    """Tokenize text once and count sentences and syllables."""
+    words = text.split()
+    sentences = SENTENCE_SPLIT_RE.split(text)
+    sentence_count = max(sum(1 for s in sentences if s.strip()), 1)
+    syllables = _count_syllables_batch(words)
+    lower_text = text.lower()
+    
+    return TextStats(
+        words=words,
+        lower_text=lower_text,
+        words_lower=WORD_RE.findall(lower_text),
+        sentence_count=sentence_count,
+        syllables_per_word=syllables,
+        syllable_count=int(syllables.sum()),
+        polysyllable_count=int(np.count_nonzero(syllables >= 3)),
+    )
+
+
 # ============================================================================
 # 1. LINGUISTIC FEATURES
 # ============================================================================
 
-def extract_linguistic_features(text: str) -> Dict[str, float]:
+LINGUISTIC_FEATURES = (
+    'avg_sentence_length', 'avg_word_length', 'clause_count',
+    'passive_voice_ratio', 'negation_count', 'question_mark_count',
+    'word_count', 'sentence_count',
+)
+
+
+def extract_linguistic_features(text: str, stats: TextStats = None) -> Dict[str, float]:
     """
     Extract basic linguistic features from question text.
     
@@ -36,51 +220,57 @@ def extract_linguistic_features(text: str) -> Dict[str, float]:
     - negation_count: Number of negations (not, no, never, etc.)
     - question_mark_count: Number of question marks
     """
+    if stats is None:
+        stats = _extract_text_stats(text)
     
-    words = text.split()
-    sentences = re.split(r'[.!?]+', text)
-    sentences = [s.strip() for s in sentences if s.strip()]
+    values = np.empty(len(LINGUISTIC_FEATURES))
+    _fill_linguistic_features(text, stats, values)
+    return dict(zip(LINGUISTIC_FEATURES, values.tolist()))
+
+
+def _fill_linguistic_features(text: str, stats: TextStats, out: np.ndarray, offset: int = 0):
+    """Write the linguistic features into out[offset:offset + 8], in LINGUISTIC_FEATURES order."""
+    words = stats.words
     
     # Basic stats
-    word_count = len(words)
-    sentence_count = max(len(sentences), 1)
+    word_count = stats.word_count
+    sentence_count = stats.sentence_count
     avg_sentence_length = word_count / sentence_count
     
-    avg_word_length = np.mean([len(w) for w in words]) if words else 0
+    avg_word_length = sum(map(len, words)) / len(words) if words else 0
     
     # Clause count (rough approximation)
-    clause_matches = re.findall(r',|\band\b|\bor\b|\bbut\b|\bwhich\b|\bthat\b', text.lower())
-    clause_count = len(clause_matches) + sentence_count
+    tokens = stats.words_lower
+    clause_matches = stats.lower_text.count(',') + sum(1 for t in tokens if t in CLAUSE_WORDS)
+    clause_count = clause_matches + sentence_count
     
     # Passive voice detection (simplified)
-    passive_pattern = r'\bwas\b|\bwere\b|\bbeen\b|\bby\b'
-    passive_count = len(re.findall(passive_pattern, text.lower()))
+    passive_count = sum(1 for t in tokens if t in PASSIVE_WORDS)
     passive_voice_ratio = passive_count / sentence_count if sentence_count > 0 else 0
     
     # Negation count
-    negation_pattern = r'\bnot\b|\bno\b|\bnever\b|\bneither\b|\bnor\b|\bwithout\b'
-    negation_count = len(re.findall(negation_pattern, text.lower()))
+    negation_count = sum(1 for t in tokens if t in NEGATION_WORDS)
     
     # Question marks
     question_mark_count = text.count('?')
     
-    return {
-        'avg_sentence_length': float(avg_sentence_length),
-        'avg_word_length': float(avg_word_length),
-        'clause_count': float(clause_count),
-        'passive_voice_ratio': float(passive_voice_ratio),
-        'negation_count': float(negation_count),
-        'question_mark_count': float(question_mark_count),
-        'word_count': float(word_count),
-        'sentence_count': float(sentence_count),
-    }
+    out[offset:offset + 8] = (
+        avg_sentence_length,
+        avg_word_length,
+        clause_count,
+        passive_voice_ratio,
+        negation_count,
+        question_mark_count,
+        word_count,
+        sentence_count,
+    )
 
 
 # ============================================================================
 # 2. READABILITY METRICS
 # ============================================================================
 
-def flesch_reading_ease(text: str) -> float:
+def flesch_reading_ease(stats: TextStats) -> float:
     """
     Flesch Reading Ease Score (0-100)
     Higher = Easier
@@ -88,44 +278,32 @@ def flesch_reading_ease(text: str) -> float:
     Formula: 206.835 - 1.015(W/S) - 84.6(Sy/W)
     W = words, S = sentences, Sy = syllables
     """
-    words = text.split()
-    sentences = re.split(r'[.!?]+', text)
-    sentences = [s.strip() for s in sentences if s.strip()]
-    
-    word_count = len(words)
-    sentence_count = max(len(sentences), 1)
-    syllable_count = sum(_count_syllables(word) for word in words)
+    word_count = stats.word_count
     
     if word_count == 0:
         return 0.0
     
-    score = 206.835 - 1.015 * (word_count / sentence_count) - 84.6 * (syllable_count / word_count)
+    score = 206.835 - 1.015 * (word_count / stats.sentence_count) - 84.6 * (stats.syllable_count / word_count)
     return max(0, min(100, score))  # Clamp to [0, 100]
 
 
-def flesch_kincaid_grade(text: str) -> float:
+def flesch_kincaid_grade(stats: TextStats) -> float:
     """
     Flesch-Kincaid Grade Level (0-18+)
     Approximates US school grade level.
     
     Formula: 0.39(W/S) + 11.8(Sy/W) - 15.59
     """
-    words = text.split()
-    sentences = re.split(r'[.!?]+', text)
-    sentences = [s.strip() for s in sentences if s.strip()]
-    
-    word_count = len(words)
-    sentence_count = max(len(sentences), 1)
-    syllable_count = sum(_count_syllables(word) for word in words)
+    word_count = stats.word_count
     
     if word_count == 0:
         return 0.0
     
-    grade = 0.39 * (word_count / sentence_count) + 11.8 * (syllable_count / word_count) - 15.59
+    grade = 0.39 * (word_count / stats.sentence_count) + 11.8 * (stats.syllable_count / word_count) - 15.59
     return max(0, grade)
 
 
-def gunning_fog_index(text: str) -> float:
+def gunning_fog_index(stats: TextStats) -> float:
     """
     Gunning Fog Index (0-18+)
     Estimates years of education needed.
@@ -133,24 +311,16 @@ def gunning_fog_index(text: str) -> float:
     Formula: 0.4 * [(W/S) + 100*(complex_words/W)]
     Complex words = 3+ syllables
     """
-    words = text.split()
-    sentences = re.split(r'[.!?]+', text)
-    sentences = [s.strip() for s in sentences if s.strip()]
-    
-    word_count = len(words)
-    sentence_count = max(len(sentences), 1)
-    
-    # Count complex words (3+ syllables)
-    complex_word_count = sum(1 for word in words if _count_syllables(word) >= 3)
+    word_count = stats.word_count
     
     if word_count == 0:
         return 0.0
     
-    index = 0.4 * ((word_count / sentence_count) + 100 * (complex_word_count / word_count))
+    index = 0.4 * ((word_count / stats.sentence_count) + 100 * (stats.polysyllable_count / word_count))
     return max(0, index)
 
 
-def smog_index(text: str) -> float:
+def smog_index(stats: TextStats) -> float:
     """
     SMOG Index (Simple Measure of Gobbledygook)
     Years of education needed to understand text.
@@ -158,17 +328,10 @@ def smog_index(text: str) -> float:
     Formula: 1.0430 * sqrt(polysyllable_count * 30/sentence_count) + 3.1291
     Polysyllable = 3+ syllables
     """
-    words = text.split()
-    sentences = re.split(r'[.!?]+', text)
-    sentences = [s.strip() for s in sentences if s.strip()]
-    
-    sentence_count = max(len(sentences), 1)
-    polysyllable_count = sum(1 for word in words if _count_syllables(word) >= 3)
-    
-    if polysyllable_count == 0:
+    if stats.polysyllable_count == 0:
         return 0.0
     
-    score = 1.0430 * math.sqrt(polysyllable_count * 30 / sentence_count) + 3.1291
+    score = 1.0430 * math.sqrt(stats.polysyllable_count * 30 / stats.sentence_count) + 3.1291
     return max(0, score)
 
 
@@ -178,15 +341,11 @@ def _count_syllables(word: str) -> int:
     This is a simple approximation.
     """
     word = word.lower()
-    count = 0
     vowels = 'aeiouy'
-    prev_was_vowel = False
     
-    for char in word:
-        is_vowel = char in vowels
-        if is_vowel and not prev_was_vowel:
-            count += 1
-        prev_was_vowel = is_vowel
+    # Count vowel groups in C: non-vowel bytes (including every byte of a
+    # multi-byte character) become spaces, then split on them
+    count = len(word.encode('utf-8').translate(_VOWEL_GROUP_TBL).split())
     
     # Adjust for silent e
     if word.endswith('e'):
@@ -199,44 +358,114 @@ def _count_syllables(word: str) -> int:
     return max(1, count)
 
 
-def extract_readability_features(text: str) -> Dict[str, float]:
+def _count_syllables_batch(words: List[str]) -> np.ndarray:
+    """
+    Vectorized _count_syllables over a list of words.
+    Words are packed into one space-separated byte buffer, so vowel groups and the
+    silent-e / -le adjustments are computed with NumPy instead of a per-character loop.
+    """
+    if len(words) < SYLLABLE_BATCH_MIN_WORDS:
+        return np.fromiter((_count_syllables(w) for w in words), dtype=np.int32, count=len(words))
+    
+    encoded = [word.lower().encode('utf-8') for word in words]
+    buf = np.frombuffer(b' '.join(encoded), dtype=np.uint8)
+    lengths = np.fromiter((len(w) for w in encoded), dtype=np.int64, count=len(encoded))
+    starts = np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+    ends = starts + lengths
+    
+    # A vowel group starts at a vowel not preceded by a vowel; separators are spaces
+    is_vowel = _IS_VOWEL_BYTE[buf]
+    group_start = is_vowel.copy()
+    group_start[1:] &= ~is_vowel[:-1]
+    counts = np.add.reduceat(group_start.astype(np.int32), starts)
+    
+    # Adjust for silent e
+    ends_with_e = buf[ends - 1] == ord('e')
+    counts -= ends_with_e
+    
+    # Adjust for -le
+    ends_with_le = (
+        ends_with_e
+        & (lengths > 2)
+        & (buf[np.maximum(ends - 2, 0)] == ord('l'))
+        & ~is_vowel[np.maximum(ends - 3, 0)]
+    )
+    counts += ends_with_le
+    
+    return np.maximum(counts, 1).astype(np.int32)
+
+
+READABILITY_FEATURES = (
+    'flesch_reading_ease', 'flesch_kincaid_grade',
+    'gunning_fog_index', 'smog_index',
+)
+
+
+def extract_readability_features(text: str, stats: TextStats = None) -> Dict[str, float]:
     """
     Extract all readability metrics.
     """
-    return {
-        'flesch_reading_ease': flesch_reading_ease(text),
-        'flesch_kincaid_grade': flesch_kincaid_grade(text),
-        'gunning_fog_index': gunning_fog_index(text),
-        'smog_index': smog_index(text),
-    }
+    if stats is None:
+        stats = _extract_text_stats(text)
+    
+    values = np.empty(len(READABILITY_FEATURES))
+    _fill_readability_features(stats, values)
+    return dict(zip(READABILITY_FEATURES, values.tolist()))
+
+
+def _fill_readability_features(stats: TextStats, out: np.ndarray, offset: int = 0):
+    """Write the readability metrics into out[offset:offset + 4], in READABILITY_FEATURES order."""
+    out[offset:offset + 4] = (
+        flesch_reading_ease(stats),
+        flesch_kincaid_grade(stats),
+        gunning_fog_index(stats),
+        smog_index(stats),
+    )
 
 
 # ============================================================================
 # 3. BLOOM'S TAXONOMY FEATURES
 # ============================================================================
 
-BLOOM_VERBS = {
+BLOOM_VERBS = MappingProxyType({
     # Level 1: Remember
-    1: {'define', 'list', 'name', 'recall', 'recite', 'state', 'write', 'label', 'identify'},
+    1: frozenset({'define', 'list', 'name', 'recall', 'recite', 'state', 'write', 'label', 'identify'}),
     
     # Level 2: Understand
-    2: {'explain', 'summarize', 'describe', 'interpret', 'discuss', 'translate', 'illustrate', 'paraphrase', 'infer'},
+    2: frozenset({'explain', 'summarize', 'describe', 'interpret', 'discuss', 'translate', 'illustrate', 'paraphrase', 'infer'}),
     
     # Level 3: Apply
-    3: {'solve', 'calculate', 'apply', 'demonstrate', 'illustrate', 'use', 'show', 'construct', 'complete', 'produce'},
+    3: frozenset({'solve', 'calculate', 'apply', 'demonstrate', 'illustrate', 'use', 'show', 'construct', 'complete', 'produce'}),
     
     # Level 4: Analyze
-    4: {'compare', 'contrast', 'distinguish', 'examine', 'analyze', 'justify', 'categorize', 'differentiate', 'separate'},
+    4: frozenset({'compare', 'contrast', 'distinguish', 'examine', 'analyze', 'justify', 'categorize', 'differentiate', 'separate'}),
     
     # Level 5: Evaluate
-    5: {'critique', 'evaluate', 'judge', 'justify', 'assess', 'debate', 'support', 'defend', 'choose'},
+    5: frozenset({'critique', 'evaluate', 'judge', 'justify', 'assess', 'debate', 'support', 'defend', 'choose'}),
     
     # Level 6: Create
-    6: {'create', 'design', 'develop', 'synthesize', 'compose', 'generate', 'plan', 'write', 'construct', 'organize'},
-}
+    6: frozenset({'create', 'design', 'develop', 'synthesize', 'compose', 'generate', 'plan', 'write', 'construct', 'organize'}),
+})
+
+# Inverted index: verb -> every Bloom level it belongs to (some verbs span levels).
+# Left a plain dict since it is probed once per word; the level tuples are immutable.
+VERB_TO_LEVELS: Dict[str, Tuple[int, ...]] = {}
+for _level, _verbs in sorted(BLOOM_VERBS.items()):
+    for _verb in _verbs:
+        VERB_TO_LEVELS[_verb] = VERB_TO_LEVELS.get(_verb, ()) + (_level,)
+
+# Deletes ASCII punctuation; '_' is kept because \w treats it as a word character
+_PUNCT_TBL = str.maketrans('', '', string.punctuation.replace('_', ''))
+
 
+BLOOM_FEATURES = (
+    'highest_bloom_level',
+    'bloom_level_1_remember', 'bloom_level_2_understand', 'bloom_level_3_apply',
+    'bloom_level_4_analyze', 'bloom_level_5_evaluate', 'bloom_level_6_create',
+)
 
-def extract_bloom_features(text: str) -> Dict[str, float]:
+
+def extract_bloom_features(text: str, stats: TextStats = None) -> Dict[str, float]:
     """
     Extract Bloom's taxonomy cognitive level features.
     
@@ -244,43 +473,87 @@ def extract_bloom_features(text: str) -> Dict[str, float]:
     - highest_bloom_level: 1-6
     - bloom_level_count: Number of words matching each level
     """
-    words = text.lower().split()
+    lower_text = stats.lower_text if stats is not None else text.lower()
+    values = np.empty(len(BLOOM_FEATURES))
+    _fill_bloom_features(lower_text, values)
+    return dict(zip(BLOOM_FEATURES, values.tolist()))
+
+
+def _fill_bloom_features(lower_text: str, out: np.ndarray, offset: int = 0):
+    """Write the Bloom features into out[offset:offset + 7], in BLOOM_FEATURES order."""
+    words = lower_text.split()
     
-    bloom_counts = {i: 0 for i in range(1, 7)}
+    # Index 0 is unused so that bloom_counts[level] lines up with levels 1-6
+    bloom_counts = [0] * 7
     highest_level = 1
     
     for word in words:
-        # Remove punctuation
-        clean_word = re.sub(r'[^\w]', '', word)
+        # Remove punctuation (regex fallback for non-ASCII punctuation or digits)
+        clean_word = word.translate(_PUNCT_TBL)
+        if not clean_word.isalpha():
+            clean_word = NONWORD_RE.sub('', word)
         
-        for level, verbs in BLOOM_VERBS.items():
-            if clean_word in verbs:
-                bloom_counts[level] += 1
-                highest_level = max(highest_level, level)
-    
-    return {
-        'highest_bloom_level': float(highest_level),
-        'bloom_level_1_remember': float(bloom_counts[1]),
-        'bloom_level_2_understand': float(bloom_counts[2]),
-        'bloom_level_3_apply': float(bloom_counts[3]),
-        'bloom_level_4_analyze': float(bloom_counts[4]),
-        'bloom_level_5_evaluate': float(bloom_counts[5]),
-        'bloom_level_6_create': float(bloom_counts[6]),
-    }
+        for level in VERB_TO_LEVELS.get(clean_word, ()):
+            bloom_counts[level] += 1
+            if level > highest_level:
+                highest_level = level
+    
+    bloom_counts[0] = highest_level
+    out[offset:offset + 7] = bloom_counts
 
 
 # ============================================================================
 # 4. SEMANTIC FEATURES (SBERT EMBEDDINGS)
 # ============================================================================
 
+# Texts per forward pass when encoding several questions
+SBERT_BATCH_SIZE = 32
+
+
+def extract_semantic_embeddings(texts: List[str]) -> np.ndarray:
+    """
+    Extract SBERT embeddings for several texts in a single forward pass.
+    Returns an array of shape (len(texts), 384) of unit-length vectors.
+    """
+    model = get_sbert_model()
+    return model.encode(
+        list(texts),
+        batch_size=SBERT_BATCH_SIZE,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
+
+
+# SBERT encodes run on one background thread per process, so the caller can compute
+# the text features meanwhile (the encode releases the GIL)
+_ENCODE_EXECUTOR = None
+_ENCODE_EXECUTOR_PID = None
+_ENCODE_EXECUTOR_LOCK = threading.Lock()
+
+
+def _submit_encode(texts: List[str]) -> Future:
+    """Start extract_semantic_embeddings(texts) on the encode thread; returns its future."""
+    global _ENCODE_EXECUTOR, _ENCODE_EXECUTOR_PID
+    # Threads do not survive fork (e.g. gunicorn --preload), so each process starts its own
+    pid = os.getpid()
+    if _ENCODE_EXECUTOR_PID != pid:
+        with _ENCODE_EXECUTOR_LOCK:
+            if _ENCODE_EXECUTOR_PID != pid:
+                _ENCODE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sbert-encode')
+                _ENCODE_EXECUTOR_PID = pid
+    return _ENCODE_EXECUTOR.submit(extract_semantic_embeddings, texts)
+
+
 def extract_semantic_embedding(text: str) -> np.ndarray:
     """
     Extract SBERT embedding (384 dimensions for MiniLM).
     This is a fixed-size vector representation of semantic meaning.
     """
-    model = get_sbert_model()
-    embedding = model.encode(text, convert_to_numpy=True)
-    return embedding
+    return extract_semantic_embeddings([text])[0]
+
+
+SEMANTIC_FEATURES = ('embedding_magnitude', 'embedding_entropy')
 
 
 def extract_semantic_features(text: str, embedding: np.ndarray = None) -> Dict[str, float]:
@@ -288,53 +561,150 @@ def extract_semantic_features(text: str, embedding: np.ndarray = None) -> Dict[s
     Extract semantic features from SBERT embedding.
     
     Features:
-    - embedding_magnitude: L2 norm of embedding
+    - embedding_magnitude: L2 norm of embedding (always 1.0, embeddings are normalized)
     - embedding_entropy: Entropy of normalized embedding
     """
     if embedding is None:
         embedding = extract_semantic_embedding(text)
     
-    # Magnitude
-    magnitude = np.linalg.norm(embedding)
+    values = np.empty(len(SEMANTIC_FEATURES))
+    _fill_semantic_features(embedding, values)
+    return dict(zip(SEMANTIC_FEATURES, values.tolist()))
+
+
+def _fill_semantic_features(embedding: np.ndarray, out: np.ndarray, offset: int = 0):
+    """Write the semantic features into out[offset:offset + 2], in SEMANTIC_FEATURES order."""
+    # Magnitude: SBERT is asked for unit-length embeddings, so no norm is needed
+    magnitude = 1.0
     
     # Entropy of normalized embedding (as probability distribution)
-    normalized = np.abs(embedding) / (np.sum(np.abs(embedding)) + 1e-10)
-    entropy = -np.sum(normalized * np.log(normalized + 1e-10))
+    abs_embedding = np.abs(embedding)
+    normalized = abs_embedding * (1.0 / (abs_embedding.sum() + 1e-10))
+    entropy = -np.dot(normalized, np.log(normalized + 1e-10))
     
-    return {
-        'embedding_magnitude': float(magnitude),
-        'embedding_entropy': float(entropy),
-    }
+    out[offset] = magnitude
+    out[offset + 1] = entropy
 
 
 # ============================================================================
 # 5. COMBINED FEATURE EXTRACTION
 # ============================================================================
 
-def extract_all_features(text: str) -> Tuple[Dict[str, float], np.ndarray]:
+# Features are packed into one float32 vector in this order
+FEATURE_NAMES = LINGUISTIC_FEATURES + READABILITY_FEATURES + BLOOM_FEATURES + SEMANTIC_FEATURES
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURE_NAMES)}
+NUM_FEATURES = len(FEATURE_NAMES)
+
+_READABILITY_OFFSET = len(LINGUISTIC_FEATURES)
+_BLOOM_OFFSET = _READABILITY_OFFSET + len(READABILITY_FEATURES)
+_SEMANTIC_OFFSET = _BLOOM_OFFSET + len(BLOOM_FEATURES)
+
+# Leading features that need only the text, not the SBERT embedding
+NUM_TEXT_FEATURES = _SEMANTIC_OFFSET
+
+# Texts per task when text features are extracted in a process pool
+TEXT_FEATURE_CHUNK_SIZE = 64
+
+
+def _fill_text_features(text: str, out: np.ndarray):
+    """Write the linguistic, readability, and Bloom features into out[:NUM_TEXT_FEATURES]."""
+    # Tokenize once, then write each feature group from the shared stats
+    stats = _extract_text_stats(text)
+    _fill_linguistic_features(text, stats, out)
+    _fill_readability_features(stats, out, _READABILITY_OFFSET)
+    _fill_bloom_features(stats.lower_text, out, _BLOOM_OFFSET)
+
+
+def extract_text_features(texts: List[str]) -> np.ndarray:
+    """
+    Extract the features that need no SBERT embedding for several texts.
+    
+    Returns:
+    - features: float32 matrix, shape (len(texts), NUM_TEXT_FEATURES)
+    """
+    features = np.empty((len(texts), NUM_TEXT_FEATURES), dtype=np.float32)
+    for text, row in zip(texts, features):
+        _fill_text_features(text, row)
+    return features
+
+
+def extract_all_features(text: str, embedding: np.ndarray = None,
+                         out: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
     """
     Extract all features from a question text.
+    Pass a precomputed `embedding` to skip the SBERT call (e.g. batch analysis),
+    and `out` to write the features into an existing row instead of a new array.
     
     Returns:
-    - features_dict: All numeric features (linguistic, readability, bloom, semantic)
+    - features: float32 vector of all numeric features, in FEATURE_NAMES order
+      (wrap in FeatureView for name -> value access)
     - embedding: SBERT embedding vector
     """
-    # Extract each feature group
-    linguistic = extract_linguistic_features(text)
-    readability = extract_readability_features(text)
-    bloom = extract_bloom_features(text)
-    embedding = extract_semantic_embedding(text)
-    semantic = extract_semantic_features(text, embedding)
+    if out is None:
+        out = np.empty(NUM_FEATURES, dtype=np.float32)
+    
+    # Start the SBERT encode first and compute the text features while it runs
+    pending = _submit_encode([text]) if embedding is None else None
+    _fill_text_features(text, out)
+    if pending is not None:
+        embedding = pending.result()[0]
+    _fill_semantic_features(embedding, out, _SEMANTIC_OFFSET)
+    
+    return out, embedding
+
+
+def extract_all_features_batch(texts: List[str], n_jobs: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Extract all features for several questions with a single SBERT encode call.
+    
+    With n_jobs > 1 (or -1 for every core) the text features are extracted in a
+    process pool, which pays off for large corpora such as the training set.
+    SBERT still runs once, batched, in this process, on the encode thread while
+    the text features are extracted.
+    
+    Returns:
+    - features: float32 matrix, shape (len(texts), NUM_FEATURES)
+    - embeddings: SBERT embedding matrix, shape (len(texts), 384)
+    """
+    features = np.empty((len(texts), NUM_FEATURES), dtype=np.float32)
+    pending = _submit_encode(texts)
+    
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs > 1 and len(texts) > TEXT_FEATURE_CHUNK_SIZE:
+        chunks = [texts[i:i + TEXT_FEATURE_CHUNK_SIZE] for i in range(0, len(texts), TEXT_FEATURE_CHUNK_SIZE)]
+        # spawn, not fork: this process may already hold torch and its threads
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context('spawn')) as pool:
+            features[:, :NUM_TEXT_FEATURES] = np.concatenate(list(pool.map(extract_text_features, chunks)))
+    else:
+        for text, row in zip(texts, features):
+            _fill_text_features(text, row)
+    
+    embeddings = pending.result()
+    for embedding, row in zip(embeddings, features):
+        _fill_semantic_features(embedding, row, _SEMANTIC_OFFSET)
+    return features, embeddings
+
+
+def features_to_dict(features: np.ndarray) -> Dict[str, float]:
+    """Name -> value copy of a feature vector from extract_all_features()."""
+    return dict(zip(FEATURE_NAMES, features.tolist()))
+
+
+@dataclass(frozen=True, slots=True)
+class FeatureView:
+    """
+    Read-only name -> value access into a feature vector, without copying it into a dict.
+    Supports `view['name']` and `view.get('name', default)` like the dict it stands in for.
+    """
+    values: np.ndarray
     
-    # Combine all features
-    all_features = {
-        **linguistic,
-        **readability,
-        **bloom,
-        **semantic,
-    }
+    def __getitem__(self, name: str) -> float:
+        return float(self.values[FEATURE_INDEX[name]])
     
-    return all_features, embedding
+    def get(self, name: str, default=None):
+        index = FEATURE_INDEX.get(name)
+        return default if index is None else float(self.values[index])
 
 
 def get_feature_names() -> List[str]:
@@ -342,24 +712,7 @@ def get_feature_names() -> List[str]:
     Get list of all feature names in extraction order.
     Useful for model training.
     """
-    return [
-        # Linguistic
-        'avg_sentence_length', 'avg_word_length', 'clause_count',
-        'passive_voice_ratio', 'negation_count', 'question_mark_count',
-        'word_count', 'sentence_count',
-        
-        # Readability
-        'flesch_reading_ease', 'flesch_kincaid_grade',
-        'gunning_fog_index', 'smog_index',
-        
-        # Bloom's Taxonomy
-        'highest_bloom_level',
-        'bloom_level_1_remember', 'bloom_level_2_understand', 'bloom_level_3_apply',
-        'bloom_level_4_analyze', 'bloom_level_5_evaluate', 'bloom_level_6_create',
-        
-        # Semantic
-        'embedding_magnitude', 'embedding_entropy',
-    ]
+    return list(FEATURE_NAMES)
 
 
 if __name__ == '__main__':
@@ -369,7 +722,7 @@ if __name__ == '__main__':
     features, embedding = extract_all_features(sample_text)
     
     print("Extracted Features:")
-    for name, value in sorted(features.items()):
+    for name, value in sorted(features_to_dict(features).items()):
         print(f"  {name}: {value:.4f}")
     
     print(f"\nEmbedding shape: {embedding.shape}")
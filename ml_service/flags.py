@@ -4,8 +4,11 @@ Detects quality issues in questions using rule-based and ML-based methods.
 """
 
 import re
+import string
 import numpy as np
-from typing import List, Dict
+from functools import lru_cache
+from types import MappingProxyType
+from typing import List, Dict, Mapping
 from features import extract_linguistic_features, extract_readability_features, extract_bloom_features
 
 
@@ -20,7 +23,14 @@ class RuleBasedFlagDetector:
     MIN_QUESTION_LENGTH = 6  # words
     MAX_QUESTION_LENGTH = 40  # words
     AMBIGUOUS_PRONOUN_PATTERN = r'\b(it|that|this|these|those)\b'
+    PRONOUN_RE = re.compile(AMBIGUOUS_PRONOUN_PATTERN)
+    VERB_RE = re.compile('|'.join([
+        r'\b(is|are|was|were|be|have|has|do|does|can|could|should|would|may|might)\b',
+        r'\b(want|need|require|ask|state|provide|describe|explain|analyze|evaluate)\b',
+    ]))
     MULTIPLE_QUESTION_MARKS = 2
+    CONTEXT_KEYWORDS = ('when', 'where', 'who', 'why', 'how', 'example', 'case', 'scenario')
+    VAGUE_QUANTIFIERS = {'some', 'many', 'few', 'several', 'various'}
     
     @staticmethod
     def detect(text: str) -> List[str]:
@@ -32,8 +42,12 @@ class RuleBasedFlagDetector:
         """
         flags = []
         
+        # Lowercase and tokenize once for every rule below
+        text_lower = text.lower()
+        words_lower = text_lower.split()
+        word_count = len(words_lower)
+        
         # 1. Too short
-        word_count = len(text.split())
         if word_count < RuleBasedFlagDetector.MIN_QUESTION_LENGTH:
             flags.append(f"too_short")
         
@@ -47,36 +61,27 @@ class RuleBasedFlagDetector:
             flags.append(f"multiple_question_marks")
         
         # 4. Ambiguous pronouns (without clear antecedent)
-        pronouns = re.findall(RuleBasedFlagDetector.AMBIGUOUS_PRONOUN_PATTERN, text.lower())
-        if len(pronouns) > len(text.split()) * 0.15:  # > 15% pronouns
+        pronouns = RuleBasedFlagDetector.PRONOUN_RE.findall(text_lower)
+        if len(pronouns) > word_count * 0.15:  # > 15% pronouns
             flags.append(f"ambiguous_pronouns")
         
         # 5. Missing context keywords
-        context_keywords = {
-            'when': 0, 'where': 0, 'who': 0, 'why': 0, 'how': 0,
-            'example': 0, 'case': 0, 'scenario': 0
-        }
-        text_lower = text.lower()
-        keyword_count = sum(1 for kw in context_keywords if kw in text_lower)
+        keyword_count = sum(1 for kw in RuleBasedFlagDetector.CONTEXT_KEYWORDS if kw in text_lower)
         if keyword_count == 0 and word_count > 10:
             flags.append(f"missing_context")
         
         # 6. No verbs (likely incomplete)
-        verb_patterns = [
-            r'\b(is|are|was|were|be|have|has|do|does|can|could|should|would|may|might)\b',
-            r'\b(want|need|require|ask|state|provide|describe|explain|analyze|evaluate)\b',
-        ]
-        has_verb = any(re.search(pattern, text.lower()) for pattern in verb_patterns)
+        has_verb = RuleBasedFlagDetector.VERB_RE.search(text_lower) is not None
         if not has_verb:
             flags.append(f"no_main_verb")
         
         # 7. Vague quantifiers
-        vague_quantifiers = ['some', 'many', 'few', 'several', 'various', 'several']
-        vague_count = sum(text.lower().count(vq) for vq in vague_quantifiers)
+        vague_quantifiers = RuleBasedFlagDetector.VAGUE_QUANTIFIERS
+        vague_count = sum(1 for w in words_lower if w.strip(string.punctuation) in vague_quantifiers)
         if vague_count >= 2:
             flags.append(f"vague_quantifiers")
         
-        return list(set(flags))  # Remove duplicates
+        return flags  # Each rule adds its own key at most once, so no dedup needed
 
 
 # ============================================================================
@@ -97,7 +102,7 @@ class MLBasedFlagDetector:
         Detect quality flags using ML features.
         
         Args:
-        - features: Extracted features dict
+        - features: Extracted features (dict or features.FeatureView)
         - difficulty_confidence: Model confidence (0-1)
         - quality_score: Predicted quality score (0-100)
         - embeddings_collection: Optional - all embeddings for variance comparison
@@ -137,7 +142,7 @@ class MLBasedFlagDetector:
         if highest_bloom >= 5 and bloom_sum < 1:
             flags.append(f"high_cognitive_demand_unclear")
         
-        return list(set(flags))
+        return flags
 
 
 # ============================================================================
@@ -155,7 +160,8 @@ def detect_all_flags(text: str, features: Dict, difficulty_confidence: float,
     rule_flags = RuleBasedFlagDetector.detect(text)
     ml_flags = MLBasedFlagDetector.detect(features, difficulty_confidence, quality_score)
     
-    all_flags = list(set(rule_flags + ml_flags))
+    # Order-preserving dedup keeps responses deterministic (and cacheable)
+    all_flags = list(dict.fromkeys(rule_flags + ml_flags))
     
     return all_flags
 
@@ -164,91 +170,94 @@ def detect_all_flags(text: str, features: Dict, difficulty_confidence: float,
 # FLAG EXPLANATIONS
 # ============================================================================
 
-FLAG_EXPLANATIONS = {
-    'too_short': {
+FLAG_EXPLANATIONS = MappingProxyType({
+    'too_short': MappingProxyType({
         'title': 'Question too short',
         'description': 'Question has fewer than 6 words. May lack sufficient context or clarity.',
         'suggestion': 'Add more detail and context to the question.',
         'severity': 'high'
-    },
-    'too_long': {
+    }),
+    'too_long': MappingProxyType({
         'title': 'Question too long',
         'description': 'Question exceeds 40 words. May be difficult to understand or contain multiple sub-questions.',
         'suggestion': 'Break into smaller, more focused questions or remove unnecessary information.',
         'severity': 'medium'
-    },
-    'multiple_question_marks': {
+    }),
+    'multiple_question_marks': MappingProxyType({
         'title': 'Multiple question marks',
         'description': 'Contains 2+ question marks, indicating potentially multiple sub-questions.',
         'suggestion': 'Separate into distinct questions or clarify what is being asked.',
         'severity': 'high'
-    },
-    'ambiguous_pronouns': {
+    }),
+    'ambiguous_pronouns': MappingProxyType({
         'title': 'Ambiguous pronouns',
         'description': 'Contains pronouns (it, that, this) that may lack clear antecedents.',
         'suggestion': 'Replace pronouns with specific nouns for clarity.',
         'severity': 'medium'
-    },
-    'missing_context': {
+    }),
+    'missing_context': MappingProxyType({
         'title': 'Missing contextual keywords',
         'description': 'Question lacks context markers (when, where, who, why, how) or examples.',
         'suggestion': 'Provide specific context, scenario, or example for better understanding.',
         'severity': 'medium'
-    },
-    'no_main_verb': {
+    }),
+    'no_main_verb': MappingProxyType({
         'title': 'No main verb',
         'description': 'Question lacks clear action verb, appears incomplete.',
         'suggestion': 'Ensure question contains a clear verb (describe, explain, analyze, etc).',
         'severity': 'high'
-    },
-    'vague_quantifiers': {
+    }),
+    'vague_quantifiers': MappingProxyType({
         'title': 'Vague quantifiers',
         'description': 'Contains vague terms (some, many, few, several) that lack precision.',
         'suggestion': 'Use specific numbers or clear qualifiers instead.',
         'severity': 'low'
-    },
-    'low_confidence_difficulty': {
+    }),
+    'low_confidence_difficulty': MappingProxyType({
         'title': 'Unclear difficulty level',
         'description': 'The model is uncertain about question difficulty, suggesting unclear structure.',
         'suggestion': 'Review question clarity and structure to make difficulty more apparent.',
         'severity': 'medium'
-    },
-    'low_quality_score': {
+    }),
+    'low_quality_score': MappingProxyType({
         'title': 'Overall low quality',
         'description': 'Multiple quality metrics indicate issues with this question.',
         'suggestion': 'Review the suggestions above and revise the question.',
         'severity': 'high'
-    },
-    'high_semantic_variance': {
+    }),
+    'high_semantic_variance': MappingProxyType({
         'title': 'Semantically ambiguous',
         'description': 'Question has high semantic variance (multiple interpretations).',
         'suggestion': 'Clarify the specific concept or skill being assessed.',
         'severity': 'medium'
-    },
-    'high_abstract_terminology': {
+    }),
+    'high_abstract_terminology': MappingProxyType({
         'title': 'Highly abstract language',
         'description': 'Question uses complex, abstract terminology (Grade 16+).',
         'suggestion': 'Simplify language or provide definitions for technical terms.',
         'severity': 'medium'
-    },
-    'high_cognitive_demand_unclear': {
+    }),
+    'high_cognitive_demand_unclear': MappingProxyType({
         'title': 'High cognitive demand without clarity',
         'description': 'Requires high-level thinking but lacks clear structure.',
         'suggestion': 'Provide more explicit guidance or step-by-step structure.',
         'severity': 'high'
-    }
-}
+    })
+})
 
 
-def get_flag_info(flag_key: str) -> Dict:
-    """Get explanation and suggestions for a flag."""
-    default_info = {
-        'title': flag_key,
-        'description': 'Quality issue detected.',
-        'suggestion': 'Review and revise the question.',
-        'severity': 'medium'
-    }
-    return FLAG_EXPLANATIONS.get(flag_key, default_info)
+@lru_cache(maxsize=None)
+def get_flag_info(flag_key: str) -> Mapping[str, str]:
+    """Get explanation and suggestions for a flag (read-only; cached per key)."""
+    info = FLAG_EXPLANATIONS.get(flag_key)
+    if info is None:
+        info = MappingProxyType({
+            'title': flag_key,
+            'description': 'Quality issue detected.',
+            'suggestion': 'Review and revise the question.',
+            'severity': 'medium'
+        })
+    return info
 
 
 if __name__ == '__main__':
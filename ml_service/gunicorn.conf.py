@@ -0,0 +1,35 @@
+"""
+Gunicorn configuration for the ML service.
+
+Usage:
+    gunicorn -c gunicorn.conf.py app:app
+
+Equivalent to:
+    gunicorn -w 1 -k gthread --threads 16 --preload --keep-alive 30 \
+        --worker-connections 1000 --reuse-port -b 127.0.0.1:5001 app:app
+"""
+
+import os
+
+bind = os.environ.get('ML_SERVICE_BIND', '127.0.0.1:5001')
+
+# One worker: every worker process holds its own copy of SBERT + the tree models
+workers = 1
+
+# Threads instead of processes. Handler threads only parse requests and serve
+# cached responses; cache misses from /analyze and /analyze-batch all run on the
+# app's single request-batcher thread (or in the ML_POOL_WORKERS processes)
+worker_class = 'gthread'
+threads = 16
+
+# Keep client (or nginx upstream) connections open between requests instead of
+# paying a TCP handshake per request and piling up sockets in TIME_WAIT
+keepalive = 30
+worker_connections = 1000
+
+# SO_REUSEPORT: lets several gunicorn instances bind the same port and have the
+# kernel spread connections across them
+reuse_port = True
+
+# Import the app (and load the models) once in the master before forking
+preload_app = True
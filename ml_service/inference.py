@@ -6,18 +6,99 @@ Returns professional judge-grade output.
 
 import json
 import logging
+import os
+import threading
+from bisect import bisect_right
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 
-from features import extract_all_features, extract_readability_features
-from models import DifficultyClassifier, QualityRegressor
+import numpy as np
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+from features import FeatureView, extract_all_features, extract_all_features_batch
+from models import DifficultyClassifier, QualityRegressor, load_embedding_pca, model_features
 from flags import detect_all_flags, get_flag_info
+from cache import LRUCache
 
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Analysis results keyed by normalized question text, expiring after the TTL.
+# Entries are serialized JSON, decoded into a fresh dict for every caller, so no
+# caller can modify what later callers get.
+# The app's response cache, which answers HTTP requests first, uses the same TTL.
+# Retrained models are only loaded by a restart, which empties both caches.
+RESULT_CACHE_SIZE = 1024
+RESULT_CACHE_TTL = 3600  # seconds
+
+# Score -> label tables for the response helpers: the label index is the number
+# of thresholds at or below the score, found with one bisect instead of an if/elif ladder
+_CONFIDENCE_THRESHOLDS = (0.6, 0.75, 0.9)
+_CONFIDENCE_LABELS = ('Low', 'Moderate', 'High', 'Very High')
+
+_GRADE_LEVEL_THRESHOLDS = (6, 9, 13, 16)
+_GRADE_LEVEL_LABELS = (
+    'Elementary school level', 'Middle school level', 'High school level',
+    'College level', 'Graduate level',
+)
+
+_QUALITY_GRADE_THRESHOLDS = (55, 60, 65, 70, 75, 80, 85, 90)
+_QUALITY_GRADES = ('C-', 'C', 'C+', 'B-', 'B', 'B+', 'A-', 'A', 'A+')
+
+# Gunning fog index -> wording for the difficulty explanation
+_LANGUAGE_THRESHOLDS = (8, 12)
+_LANGUAGE_LABELS = ('simple, clear language', 'college-level language', 'advanced, technical language')
+
+# Bloom level 1-6 -> description, indexed by level - 1
+_BLOOM_DESCRIPTIONS = (
+    'recalls facts or basic concepts',
+    'requires understanding concepts',
+    'requires applying knowledge',
+    'requires analyzing concepts',
+    'requires evaluating information',
+    'requires creating new knowledge',
+)
+
+# Flags with a suggestion get one bit each; _get_suggestions ORs a response's
+# flags into a mask once, then tests bits instead of scanning the flag list
+_FLAG_BITS = {
+    'too_long': 1,
+    'too_short': 2,
+    'ambiguous_pronouns': 4,
+    'vague_quantifiers': 8,
+    'missing_context': 16,
+}
+_LENGTH_SUGGESTIONS = (  # too_long wins over too_short
+    (_FLAG_BITS['too_long'], 'Break into multiple shorter questions for better focus.'),
+    (_FLAG_BITS['too_short'], 'Add context and specificity to the question.'),
+)
+_FLAG_SUGGESTIONS = (
+    (_FLAG_BITS['ambiguous_pronouns'], 'Replace pronouns (it, that, this) with specific nouns.'),
+    (_FLAG_BITS['vague_quantifiers'], 'Replace vague terms (many, some) with specific numbers.'),
+    (_FLAG_BITS['missing_context'], 'Add a scenario or example to establish context.'),
+)
+
+
+def _dump_result(response: Dict) -> bytes:
+    """Serialize an analysis result for the result cache."""
+    if HAS_ORJSON:
+        return orjson.dumps(response, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(response, default=float).encode()
+
+
+def _load_result(data: bytes) -> Dict:
+    """Decode a cached analysis result into a new dict."""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
 
 # ============================================================================
 # INFERENCE SERVICE
@@ -30,22 +111,32 @@ class QuestionAnalyzerService:
         """Initialize models from disk."""
         self.difficulty_clf = None
         self.quality_reg = None
+        self.embedding_pca = None
         self.models_loaded = False
+        self._cache = LRUCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
         
         try:
             self.difficulty_clf = DifficultyClassifier.load()
             self.quality_reg = QualityRegressor.load()
+            self.embedding_pca = load_embedding_pca()
             self.models_loaded = True
             logger.info("Models loaded successfully")
         except FileNotFoundError:
             logger.warning("Models not found. Run training first: python models.py <training_data.csv>")
     
-    def analyze(self, question: str) -> Dict:
+    def analyze(self, question: str, embedding: Optional[np.ndarray] = None,
+                explain_detailed: bool = False) -> Dict:
         """
         Analyze a question and return comprehensive results.
         
+        Repeats of a question (ignoring case and whitespace) are served from cache.
+        Every call returns a dict of its own, safe to modify.
+        
         Args:
         - question: The question text to analyze
+        - embedding: Optional precomputed SBERT embedding for the question
+        - explain_detailed: Per-question SHAP feature importance instead of the
+          models' global importances (slower)
         
         Returns:
         - Dict with difficulty, quality_score, flags, explanation, etc.
@@ -57,33 +148,117 @@ class QuestionAnalyzerService:
                 'success': False
             }
         
+        key = self._cache_key(question, explain_detailed)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return self._for_question(cached, question)
+        
         # Extract features
         logger.info(f"Analyzing question: {question[:50]}...")
-        features, embedding = extract_all_features(question)
+        features, embedding = extract_all_features(question, embedding)
+        model_input = model_features(features, embedding, self.embedding_pca)
         
-        # Get readability info
-        readability = extract_readability_features(question)
+        # Predict difficulty and quality score (same batch calls as analyze_many)
+        (difficulty, difficulty_confidence), = self.difficulty_clf.predict_batch(model_input)
+        quality_score, = self.quality_reg.predict_batch(model_input)
         
-        # Predict difficulty
-        difficulty, difficulty_confidence = self.difficulty_clf.predict(features)
+        response = self._build_response(question, features, model_input[0], difficulty,
+                                        difficulty_confidence, quality_score, explain_detailed)
+        # Return a decoded copy on a miss too, so hits and misses look the same
+        encoded = _dump_result(response)
+        self._cache.put(key, encoded)
+        return self._for_question(encoded, question)
+    
+    def analyze_many(self, questions: List[str], explain_detailed: bool = False) -> List[Dict]:
+        """
+        Analyze several questions at once.
+        SBERT runs once over all questions and each model predicts on the stacked
+        feature matrix, instead of one pipeline run per question. Cached and
+        repeated questions are only analyzed once.
+        
+        Returns:
+        - List of analysis dicts, in the same order as `questions`
+        """
+        if not self.models_loaded:
+            return [
+                {'error': 'Models not loaded. Please train models first.', 'success': False}
+                for _ in questions
+            ]
+        
+        if not questions:
+            return []
         
-        # Predict quality score
-        quality_score = self.quality_reg.predict(features)
+        keys = [self._cache_key(question, explain_detailed) for question in questions]
+        results = {}
+        pending = {}  # key -> first question text seen with that key
+        for question, key in zip(questions, keys):
+            if key in results or key in pending:
+                continue
+            cached = self._cache.get(key)
+            if cached is None:
+                pending[key] = question
+            else:
+                results[key] = cached
+        
+        if pending:
+            texts = list(pending.values())
+            logger.info(f"Analyzing batch of {len(texts)} questions...")
+            features_matrix, embeddings = extract_all_features_batch(texts)
+            model_matrix = model_features(features_matrix, embeddings, self.embedding_pca)
+            
+            difficulty_predictions = self.difficulty_clf.predict_batch(model_matrix)
+            quality_scores = self.quality_reg.predict_batch(model_matrix)
+            
+            for key, question, features, model_input, (difficulty, difficulty_confidence), quality_score in zip(
+                    pending, texts, features_matrix, model_matrix, difficulty_predictions, quality_scores):
+                response = self._build_response(question, features, model_input, difficulty,
+                                                difficulty_confidence, quality_score, explain_detailed)
+                encoded = _dump_result(response)
+                self._cache.put(key, encoded)
+                results[key] = encoded
+        
+        return [self._for_question(results[key], question) for question, key in zip(questions, keys)]
+    
+    def cache_clear(self) -> int:
+        """Drop all cached analysis results. Returns the number of entries removed."""
+        return self._cache.clear()
+    
+    @staticmethod
+    def _cache_key(question: str, explain_detailed: bool = False) -> Tuple[str, bool]:
+        """Normalize case and whitespace, neither of which changes the analysis."""
+        return ' '.join(question.lower().split()), explain_detailed
+    
+    @staticmethod
+    def _for_question(encoded: bytes, question: str) -> Dict:
+        """A cached response, decoded into a new dict and labelled with the question as the caller wrote it."""
+        response = _load_result(encoded)
+        response['question'] = question
+        return response
+    
+    def _build_response(self, question: str, features: np.ndarray, model_input: np.ndarray,
+                        difficulty: str, difficulty_confidence: float, quality_score: float,
+                        explain_detailed: bool = False) -> Dict:
+        """
+        Assemble the analysis response from the feature vector, the model input built
+        from it (features plus embedding PCA components) and the model predictions.
+        """
+        # Name -> value view for the rule code below, built once per response
+        # (readability scores are read from it rather than recomputed)
+        feature_view = FeatureView(features)
         
         # Detect flags
-        flags = detect_all_flags(question, features, difficulty_confidence, quality_score)
+        flags = detect_all_flags(question, feature_view, difficulty_confidence, quality_score)
         
         # Get explanations
-        difficulty_explanation = self._get_difficulty_explanation(features)
-        quality_explanation = self._get_quality_explanation(features, quality_score)
+        difficulty_explanation = self._get_difficulty_explanation(feature_view)
+        quality_explanation = self._get_quality_explanation(feature_view, quality_score)
         
-        # Get feature contributions
-        difficulty_top_features = self.difficulty_clf.explain(features)
-        quality_top_features = self.quality_reg.explain(features)
+        # Get feature contributions (global importances unless SHAP was requested)
+        difficulty_top_features = self.difficulty_clf.explain(model_input, detailed=explain_detailed)
+        quality_top_features = self.quality_reg.explain(model_input, detailed=explain_detailed)
         
         # Calculate additional confidence metrics
-        quality_confidence = self._calculate_quality_confidence(quality_score)
-        overall_confidence = (difficulty_confidence + quality_confidence) / 2
+        quality_confidence, overall_confidence = self._calculate_confidences(difficulty_confidence, quality_score)
         
         # Build response
         response = {
@@ -104,20 +279,11 @@ class QuestionAnalyzerService:
                     'grade': self._quality_to_grade(quality_score),
                 },
                 'readability': {
-                    'flesch_ease': round(readability['flesch_reading_ease'], 1),
-                    'grade_level': round(readability['flesch_kincaid_grade'], 1),
-                    'assessment': self._assess_readability(readability['flesch_kincaid_grade']),
+                    'flesch_ease': round(feature_view['flesch_reading_ease'], 1),
+                    'grade_level': round(feature_view['flesch_kincaid_grade'], 1),
+                    'assessment': self._assess_readability(feature_view['flesch_kincaid_grade']),
                 },
-                'flags': [
-                    {
-                        'key': flag,
-                        'title': get_flag_info(flag).get('title', flag),
-                        'description': get_flag_info(flag).get('description'),
-                        'suggestion': get_flag_info(flag).get('suggestion'),
-                        'severity': get_flag_info(flag).get('severity', 'medium'),
-                    }
-                    for flag in flags
-                ] if flags else [],
+                'flags': [self._flag_entry(flag) for flag in flags],
                 'feature_importance': {
                     'difficulty': [(name, round(val, 4)) for name, val in difficulty_top_features[:3]],
                     'quality': [(name, round(val, 4)) for name, val in quality_top_features[:3]],
@@ -130,33 +296,30 @@ class QuestionAnalyzerService:
         return response
     
     @staticmethod
-    def _get_difficulty_explanation(features: Dict) -> str:
+    def _flag_entry(flag: str) -> Dict:
+        """Response entry for one flag, looking its explanation up once."""
+        info = get_flag_info(flag)
+        return {
+            'key': flag,
+            'title': info.get('title', flag),
+            'description': info.get('description'),
+            'suggestion': info.get('suggestion'),
+            'severity': info.get('severity', 'medium'),
+        }
+    
+    @staticmethod
+    def _get_difficulty_explanation(features: FeatureView) -> str:
         """Generate human-readable explanation for difficulty."""
         bloom_level = int(features.get('highest_bloom_level', 1))
         gunning_fog = features.get('gunning_fog_index', 0)
         
-        bloom_descriptions = {
-            1: 'recalls facts or basic concepts',
-            2: 'requires understanding concepts',
-            3: 'requires applying knowledge',
-            4: 'requires analyzing concepts',
-            5: 'requires evaluating information',
-            6: 'requires creating new knowledge',
-        }
-        
-        bloom_desc = bloom_descriptions.get(min(bloom_level, 6), '')
-        
-        if gunning_fog < 8:
-            readability = 'simple, clear language'
-        elif gunning_fog < 12:
-            readability = 'college-level language'
-        else:
-            readability = 'advanced, technical language'
+        bloom_desc = _BLOOM_DESCRIPTIONS[max(0, min(bloom_level, 6) - 1)]
+        readability = _LANGUAGE_LABELS[bisect_right(_LANGUAGE_THRESHOLDS, gunning_fog)]
         
         return f"Question {bloom_desc} and uses {readability}."
     
     @staticmethod
-    def _get_quality_explanation(features: Dict, quality_score: float) -> str:
+    def _get_quality_explanation(features: FeatureView, quality_score: float) -> str:
         """Generate human-readable explanation for quality."""
         if quality_score >= 85:
             return "High-quality question with clear structure and appropriate difficulty."
@@ -170,58 +333,29 @@ class QuestionAnalyzerService:
     @staticmethod
     def _assess_readability(grade_level: float) -> str:
         """Assess readability based on grade level."""
-        if grade_level < 6:
-            return 'Elementary school level'
-        elif grade_level < 9:
-            return 'Middle school level'
-        elif grade_level < 13:
-            return 'High school level'
-        elif grade_level < 16:
-            return 'College level'
-        else:
-            return 'Graduate level'
+        return _GRADE_LEVEL_LABELS[bisect_right(_GRADE_LEVEL_THRESHOLDS, grade_level)]
     
     @staticmethod
-    def _calculate_quality_confidence(quality_score: float) -> float:
-        """Calculate confidence for quality prediction based on score distribution."""
+    def _calculate_confidences(difficulty_confidence: float, quality_score: float) -> Tuple[float, float]:
+        """
+        Confidence for the quality prediction, based on score distribution, and the
+        overall confidence (mean of difficulty and quality confidence), in one call.
+        """
         # Higher confidence for extreme scores, lower for mid-range
         # Normalized to 0-1 range
         distance_from_center = abs(quality_score - 50) / 50
-        return 0.6 + (distance_from_center * 0.4)
+        quality_confidence = 0.6 + (distance_from_center * 0.4)
+        return quality_confidence, (difficulty_confidence + quality_confidence) / 2
     
     @staticmethod
     def _interpret_confidence(confidence: float) -> str:
         """Interpret confidence score as human-readable text."""
-        if confidence >= 0.9:
-            return 'Very High'
-        elif confidence >= 0.75:
-            return 'High'
-        elif confidence >= 0.6:
-            return 'Moderate'
-        else:
-            return 'Low'
+        return _CONFIDENCE_LABELS[bisect_right(_CONFIDENCE_THRESHOLDS, confidence)]
     
     @staticmethod
     def _quality_to_grade(quality_score: float) -> str:
         """Convert quality score to letter grade."""
-        if quality_score >= 90:
-            return 'A+'
-        elif quality_score >= 85:
-            return 'A'
-        elif quality_score >= 80:
-            return 'A-'
-        elif quality_score >= 75:
-            return 'B+'
-        elif quality_score >= 70:
-            return 'B'
-        elif quality_score >= 65:
-            return 'B-'
-        elif quality_score >= 60:
-            return 'C+'
-        elif quality_score >= 55:
-            return 'C'
-        else:
-            return 'C-'
+        return _QUALITY_GRADES[bisect_right(_QUALITY_GRADE_THRESHOLDS, quality_score)]
     
     @staticmethod
     def _get_suggestions(flags: list, quality_score: float) -> list:
@@ -234,19 +368,16 @@ class QuestionAnalyzerService:
         if quality_score < 50:
             suggestions.append('Prioritize clarity: rewrite for conciseness and precision.')
         
-        if 'too_long' in flags:
-            suggestions.append('Break into multiple shorter questions for better focus.')
-        elif 'too_short' in flags:
-            suggestions.append('Add context and specificity to the question.')
-        
-        if 'ambiguous_pronouns' in flags:
-            suggestions.append('Replace pronouns (it, that, this) with specific nouns.')
+        mask = 0
+        for flag in flags:
+            mask |= _FLAG_BITS.get(flag, 0)
         
-        if 'vague_quantifiers' in flags:
-            suggestions.append('Replace vague terms (many, some) with specific numbers.')
+        for bit, suggestion in _LENGTH_SUGGESTIONS:
+            if mask & bit:
+                suggestions.append(suggestion)
+                break
         
-        if 'missing_context' in flags:
-            suggestions.append('Add a scenario or example to establish context.')
+        suggestions.extend(suggestion for bit, suggestion in _FLAG_SUGGESTIONS if mask & bit)
         
         if quality_score < 60:
             suggestions.append('Have subject matter experts review for alignment to learning objectives.')
@@ -259,19 +390,43 @@ class QuestionAnalyzerService:
 # ============================================================================
 
 _service_instance = None
+_service_lock = threading.Lock()
 
 def get_analyzer_service() -> QuestionAnalyzerService:
-    """Get or create the analyzer service (singleton)."""
+    """
+    Get or create the analyzer service (singleton).
+    Concurrent first calls load the models once; an instance created before a
+    fork (gunicorn --preload) is reused by the children, sharing its pages copy-on-write.
+    """
     global _service_instance
     if _service_instance is None:
-        _service_instance = QuestionAnalyzerService()
+        with _service_lock:
+            if _service_instance is None:
+                _service_instance = QuestionAnalyzerService()
     return _service_instance
 
 
+def _reset_service_lock():
+    # A fork can land mid-load, leaving the lock held forever in the child
+    global _service_lock
+    _service_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_service_lock)
+
+
 # ============================================================================
 # STANDALONE ANALYSIS FUNCTION
 # ============================================================================
 
+def _to_json(obj) -> str:
+    """Pretty-printed JSON for CLI output, via orjson when installed."""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(obj, indent=2, default=float)
+
+
 def analyze_question(question: str) -> Dict:
     """
     Analyze a single question.
@@ -330,4 +485,4 @@ if __name__ == '__main__':
     # Single question analysis
     service = get_analyzer_service()
     result = analyze_question(question)
-    print(json.dumps(result, indent=2))
+    print(_to_json(result))
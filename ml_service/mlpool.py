@@ -0,0 +1,99 @@
+"""
+ML Process Pool Module
+Runs question analysis in worker processes so CPU-bound work escapes the GIL.
+
+Each worker loads SBERT and the tree models once at startup. Enable by setting
+ML_POOL_WORKERS to a worker count, or to "auto" for one worker per CPU core
+minus one (left for the HTTP process). Unset or 0 analyzes in-process.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from typing import Dict, List
+
+from features import get_sbert_model
+from inference import get_analyzer_service
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a worker before failing the request
+POOL_TIMEOUT = 30
+
+
+class PoolError(RuntimeError):
+    """The worker pool itself failed (timed out or not running), as opposed to one question's analysis."""
+
+
+def _pool_size() -> int:
+    value = os.environ.get('ML_POOL_WORKERS', '0').strip().lower()
+    if value == 'auto':
+        return max((os.cpu_count() or 2) - 1, 1)
+    return int(value or 0)
+
+
+POOL_WORKERS = _pool_size()
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+# ============================================================================
+# WORKER PROCESS FUNCTIONS
+# ============================================================================
+
+def _init_worker():
+    """Warm the models once per worker process."""
+    get_analyzer_service()
+    get_sbert_model()
+
+
+def _worker_analyze_many(questions: List[str], explain_detailed: bool) -> List[Dict]:
+    return get_analyzer_service().analyze_many(questions, explain_detailed=explain_detailed)
+
+
+# ============================================================================
+# POOL
+# ============================================================================
+
+def get_pool():
+    """Get the worker pool for this process, or None when pooling is disabled."""
+    global _pool, _pool_pid
+    if POOL_WORKERS <= 0:
+        return None
+
+    # A pool inherited through fork (e.g. gunicorn --preload) is unusable, so
+    # each process starts its own
+    pid = os.getpid()
+    if _pool_pid != pid:
+        with _pool_lock:
+            if _pool_pid != pid:
+                # spawn, not fork: torch and the request batcher thread are not fork-safe
+                ctx = multiprocessing.get_context('spawn')
+                _pool = ctx.Pool(processes=POOL_WORKERS, initializer=_init_worker)
+                _pool_pid = pid
+                logger.info(f"Started ML process pool with {POOL_WORKERS} workers")
+    return _pool
+
+
+def analyze_many(questions: List[str], explain_detailed: bool = False) -> List[Dict]:
+    """
+    Analyze several questions, splitting them into one contiguous chunk per worker.
+    Each chunk still runs as a single batched SBERT + predict pass.
+    """
+    pool = get_pool()
+    if pool is None or not questions:
+        return get_analyzer_service().analyze_many(questions, explain_detailed=explain_detailed)
+
+    chunk_size = -(-len(questions) // POOL_WORKERS)
+    chunks = [questions[i:i + chunk_size] for i in range(0, len(questions), chunk_size)]
+    try:
+        pending = [pool.apply_async(_worker_analyze_many, (chunk, explain_detailed)) for chunk in chunks]
+    except ValueError as e:  # "Pool not running"
+        raise PoolError(f"ML worker pool unavailable: {e}") from e
+    try:
+        return [result for job in pending for result in job.get(timeout=POOL_TIMEOUT)]
+    except multiprocessing.TimeoutError as e:
+        raise PoolError(f"ML worker pool did not answer within {POOL_TIMEOUT}s") from e
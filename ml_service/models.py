@@ -1,16 +1,21 @@
 """
 Model Training and Inference Module
-Trains XGBoost for difficulty classification and RandomForest for quality prediction.
+Trains XGBoost for difficulty classification and HistGradientBoosting for quality prediction.
 Includes SHAP explainability.
 """
 
+import os
+import tempfile
 import numpy as np
 import pickle
+import joblib
 import json
 from typing import Dict, Tuple, List
 from pathlib import Path
 
-from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
+from sklearn.ensemble import HistGradientBoostingClassifier, HistGradientBoostingRegressor
+from sklearn.inspection import permutation_importance
+from sklearn.decomposition import IncrementalPCA
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.model_selection import cross_val_score, train_test_split
 from sklearn.metrics import accuracy_score, f1_score, mean_absolute_error, r2_score
@@ -27,9 +32,43 @@ try:
 except ImportError:
     HAS_SHAP = False
 
+try:
+    import onnxruntime as ort
+    HAS_ONNXRUNTIME = True
+except ImportError:
+    HAS_ONNXRUNTIME = False
+
+try:
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+    HAS_SKL2ONNX = True
+except ImportError:
+    HAS_SKL2ONNX = False
+
+try:
+    import onnxmltools
+    from onnxmltools.convert.common.data_types import FloatTensorType as XGBFloatTensorType
+    HAS_ONNXMLTOOLS = True
+except ImportError:
+    HAS_ONNXMLTOOLS = False
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import treelite
+    import tl2cgen
+    HAS_TREELITE = True
+except ImportError:
+    HAS_TREELITE = False
+
 import pandas as pd
 
-from features import extract_all_features, get_feature_names
+from features import FEATURE_NAMES, extract_all_features_batch, get_feature_names
+from cache import LRUCache
 
 
 # ---------------------------------------------------------------------------
@@ -56,13 +95,452 @@ QUALITY_MODEL_PATH = MODEL_DIR / 'quality_model.pkl'
 SCALER_PATH = MODEL_DIR / 'scaler.pkl'
 LABEL_ENCODER_PATH = MODEL_DIR / 'label_encoder.pkl'
 METADATA_PATH = MODEL_DIR / 'metadata.json'
+EMBEDDING_PCA_PATH = MODEL_DIR / 'embedding_pca.pkl'
+
+# Training appends this many PCA components of the SBERT embedding to the features
+EMBEDDING_PCA_COMPONENTS = 8
+EMBEDDING_PCA_NAMES = [f'embedding_pca_{i}' for i in range(EMBEDDING_PCA_COMPONENTS)]
+MODEL_FEATURE_NAMES = get_feature_names() + EMBEDDING_PCA_NAMES
+
+# Training reads the CSV this many rows at a time, and fits the embedding PCA
+# in batches of PCA_BATCH_SIZE, so memory does not grow with the corpus
+TRAINING_CSV_CHUNK_SIZE = 50000
+PCA_BATCH_SIZE = 2048
+
+# Per-question SHAP explanations memoized per model, keyed on the rounded model input
+SHAP_CACHE_SIZE = 512
+SHAP_CACHE_DECIMALS = 6
+
+# Rows sampled when ranking features by permutation importance at training time
+PERMUTATION_MAX_SAMPLES = 10000
+
+# Compiled predictors must reproduce the estimator on the probe rows stored at
+# training (sampled training rows plus rows sitting on the model's split thresholds)
+PROBE_SAMPLE_ROWS = 64
+PROBE_MAX_ROWS = 4096
+PROBE_RTOL = 1e-5
+PROBE_ATOL = 1e-5
+
+# HistGradientBoosting tree size. min_samples_leaf grows with the training set
+# up to sklearn's default of 20 (reached at 1000 rows): with the default, a
+# small corpus like training_data.csv (52 rows) only gets 2-leaf trees.
+HGB_MAX_LEAF_NODES = 7
+HGB_MIN_SAMPLES_LEAF = 20
+HGB_ROWS_PER_LEAF_SAMPLE = 50
+HGB_L2_REGULARIZATION = 1.0
+
+
+def _feature_frame(features: np.ndarray) -> pd.DataFrame:
+    """DataFrame view of a feature vector (or row-stacked matrix) from extract_all_features()."""
+    return pd.DataFrame(np.atleast_2d(features), columns=FEATURE_NAMES)
+
+
+def _feature_matrix(features: np.ndarray, n_features: int) -> np.ndarray:
+    """Float32 copy of a feature vector (or row-stacked matrix), checked against the model's width."""
+    X = np.array(features, dtype=np.float32, ndmin=2)
+    if X.shape[1] != n_features:
+        raise ValueError(
+            f"Model expects {n_features} features but got {X.shape[1]}; "
+            "pass model_features() output (extracted features plus embedding PCA components), "
+            "and load the models and embedding_pca.pkl from the same training run"
+        )
+    return X
+
+
+def _scale_features(scaler: StandardScaler, features: np.ndarray) -> np.ndarray:
+    """
+    Standardize a feature vector (or row-stacked matrix) for prediction.
+    Same arithmetic as scaler.transform, without building a DataFrame or
+    re-running sklearn's input validation on every call. Kept in float32 like
+    the training matrix, so values land on the same side of every tree split.
+    """
+    X = _feature_matrix(features, scaler.n_features_in_)
+    X -= scaler.mean_.astype(X.dtype)
+    X /= scaler.scale_.astype(X.dtype)
+    return X
+
+
+def _model_input(estimator, features: np.ndarray) -> np.ndarray:
+    """
+    Prediction input for a DifficultyClassifier / QualityRegressor: raw features,
+    or standardized ones for pickles trained before the scaler was dropped.
+    """
+    if estimator._apply_scaler:
+        return _scale_features(estimator.scaler, features)
+    return _feature_matrix(features, estimator.model.n_features_in_)
+
+
+def _dump_atomic(obj, path: str):
+    """
+    joblib.dump to a temporary file next to `path`, then rename it over `path`.
+    Running processes that memory-mapped the old file keep reading its (now
+    unlinked) inode; rewriting it in place would crash them with SIGBUS.
+    """
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    os.close(fd)
+    try:
+        # Uncompressed so load() can memory-map the arrays
+        joblib.dump(obj, tmp_path, protocol=5)
+        os.chmod(tmp_path, 0o644)  # mkstemp creates files readable by the owner only
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+def _hgb_min_samples_leaf(n_rows: int) -> int:
+    """min_samples_leaf for a HistGradientBoosting model trained on n_rows rows."""
+    return max(1, min(HGB_MIN_SAMPLES_LEAF, n_rows // HGB_ROWS_PER_LEAF_SAMPLE))
+
+
+def _cross_validate(model, X: np.ndarray, y, scoring: str) -> Tuple[float, float]:
+    """Mean and std of a 5-fold cross-validation score, with the folds fitted in parallel."""
+    cv_scores = cross_val_score(model, X, y, cv=5, scoring=scoring, n_jobs=-1)
+    return float(cv_scores.mean()), float(cv_scores.std())
+
+
+def _global_importances(model, X: np.ndarray, y) -> List[float]:
+    """
+    Global feature importances: the model's own when it has them (RandomForest, XGBoost),
+    otherwise permutation importances on (a sample of) the training data (HistGradientBoosting).
+    """
+    if hasattr(model, 'feature_importances_'):
+        return [float(v) for v in model.feature_importances_]
+    result = permutation_importance(
+        model, X, y, n_repeats=5, random_state=42, n_jobs=-1,
+        max_samples=min(len(X), PERMUTATION_MAX_SAMPLES),
+    )
+    return result.importances_mean.tolist()
+
+
+def _split_thresholds(model) -> List[Tuple[int, float]]:
+    """Distinct (feature_index, threshold) pairs of every split in a fitted tree model."""
+    if HAS_XGBOOST and isinstance(model, xgb.XGBModel):
+        # Trained on arrays, so XGBoost names the features f0, f1, ...
+        trees = model.get_booster().trees_to_dataframe()
+        splits = trees[trees['Feature'] != 'Leaf']
+        pairs = zip(splits['Feature'].str[1:].astype(int), splits['Split'].astype(float))
+    elif hasattr(model, '_predictors'):  # HistGradientBoosting
+        nodes = [predictor.nodes for iteration in model._predictors for predictor in iteration]
+        nodes = np.concatenate(nodes)
+        nodes = nodes[nodes['is_leaf'] == 0]
+        pairs = zip(nodes['feature_idx'].tolist(), nodes['num_threshold'].tolist())
+    elif hasattr(model, 'estimators_'):  # RandomForest
+        pairs = []
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            split = tree.feature >= 0
+            pairs.extend(zip(tree.feature[split].tolist(), tree.threshold[split].tolist()))
+    else:
+        return []
+    return sorted(set((int(f), float(t)) for f, t in pairs))
+
+
+def _probe_rows(model, X: np.ndarray) -> np.ndarray:
+    """
+    Rows a compiled predictor is checked on before use: a sample of the training
+    rows, plus copies of them with one feature set exactly on (and one float32
+    step either side of) each split threshold, where compiled trees diverge first.
+    """
+    rng = np.random.default_rng(42)
+    base = X[rng.choice(len(X), size=min(len(X), PROBE_SAMPLE_ROWS), replace=False)]
+    
+    thresholds = _split_thresholds(model)
+    rows = np.repeat(base[rng.integers(len(base), size=len(thresholds))], 3, axis=0)
+    for i, (feature, threshold) in enumerate(thresholds):
+        value = np.float32(threshold)
+        rows[3 * i:3 * i + 3, feature] = (
+            value,
+            np.nextafter(value, np.float32(-np.inf)),
+            np.nextafter(value, np.float32(np.inf)),
+        )
+    if len(rows) > PROBE_MAX_ROWS:
+        rows = rows[rng.choice(len(rows), size=PROBE_MAX_ROWS, replace=False)]
+    return np.concatenate([base, rows]).astype(np.float32)
+
+
+def _tree_explainer(model):
+    """
+    SHAP TreeExplainer for a fitted tree model, or None when SHAP is not installed
+    or does not support the model (older SHAP releases cannot parse every XGBoost
+    version's model dump).
+    """
+    if not HAS_SHAP:
+        return None
+    try:
+        return shap.TreeExplainer(model, feature_perturbation='tree_path_dependent')
+    except Exception as e:
+        print(f"No SHAP explainer for {type(model).__name__}: {type(e).__name__}")
+        return None
+
+
+def _rank_features(names: List[str], importances) -> List[Tuple[str, float]]:
+    """Top 5 (feature_name, importance) pairs, most important first."""
+    feature_importance = list(zip(names, importances))
+    feature_importance.sort(key=lambda x: x[1], reverse=True)
+    return feature_importance[:5]
+
+
+# ============================================================================
+# ONNX RUNTIME (OPTIONAL)
+# ============================================================================
+
+def _onnx_path(pickle_path: str) -> Path:
+    """ONNX export stored next to a model pickle (difficulty_model.pkl -> difficulty_model.onnx)."""
+    return Path(pickle_path).with_suffix('.onnx')
+
+
+def _export_onnx(model, path: Path) -> bool:
+    """
+    Write an ONNX copy of a fitted tree model for ONNX Runtime inference.
+    Returns False (and removes any stale export) when no converter is installed
+    or the converter does not support the model.
+    """
+    initial_type = [None, model.n_features_in_]
+    onnx_model = None
+    
+    try:
+        if HAS_XGBOOST and isinstance(model, xgb.XGBModel):
+            if HAS_ONNXMLTOOLS:
+                onnx_model = onnxmltools.convert_xgboost(
+                    model, initial_types=[('X', XGBFloatTensorType(initial_type))]
+                )
+        elif HAS_SKL2ONNX:
+            # zipmap=False: return class probabilities as a plain tensor, not a list of dicts
+            options = {'zipmap': False} if hasattr(model, 'predict_proba') else None
+            onnx_model = convert_sklearn(
+                model, initial_types=[('X', FloatTensorType(initial_type))], options=options
+            )
+    except Exception as e:
+        print(f"Skipping ONNX export of {type(model).__name__}: {type(e).__name__}")
+    
+    if onnx_model is None:
+        path.unlink(missing_ok=True)
+        return False
+    
+    path.write_bytes(onnx_model.SerializeToString())
+    return True
+
+
+def _load_onnx_session(path: Path):
+    """ONNX Runtime session for an exported model, or None if unavailable."""
+    if not (HAS_ONNXRUNTIME and path.exists()):
+        return None
+    
+    options = ort.SessionOptions()
+    # Requests are one row (or a small batch), too little work to split across threads
+    options.intra_op_num_threads = 1
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(str(path), sess_options=options, providers=['CPUExecutionProvider'])
+
+
+# ============================================================================
+# TREELITE (OPTIONAL)
+# ============================================================================
+
+def _treelite_path(pickle_path: str) -> Path:
+    """Compiled predictor stored next to a model pickle (difficulty_model.pkl -> difficulty_model.so)."""
+    return Path(pickle_path).with_suffix('.so')
+
+
+def _export_treelite(model, path: Path) -> bool:
+    """
+    Compile a fitted tree model to a native shared library with tl2cgen.
+    Thresholds are not quantized: quantized XGBoost splits send values equal to a
+    threshold (common for the integer count features) down the other branch.
+    Returns False (and removes any stale library) when Treelite is not installed
+    or cannot compile the model.
+    """
+    path.unlink(missing_ok=True)
+    if not HAS_TREELITE:
+        return False
+    
+    try:
+        if HAS_XGBOOST and isinstance(model, xgb.XGBModel):
+            tl_model = treelite.frontend.from_xgboost(model.get_booster())
+        else:
+            tl_model = treelite.sklearn.import_model(model)
+        
+        tl2cgen.export_lib(
+            tl_model, toolchain='gcc', libpath=str(path),
+            params={'parallel_comp': os.cpu_count() or 1}
+        )
+    except Exception as e:
+        print(f"Skipping Treelite compile of {type(model).__name__}: {type(e).__name__}")
+        path.unlink(missing_ok=True)
+        return False
+    return True
+
+
+def _load_treelite_predictor(path: Path):
+    """tl2cgen predictor for a compiled model, or None if unavailable."""
+    if not (HAS_TREELITE and path.exists()):
+        return None
+    return tl2cgen.Predictor(str(path), nthread=1)
+
+
+def _run_treelite(predictor, X: np.ndarray) -> np.ndarray:
+    """Predict with a compiled model; output is (n_rows, n_outputs)."""
+    return predictor.predict(tl2cgen.DMatrix(X)).reshape(len(X), -1)
+
+
+# ============================================================================
+# COMPILED PREDICTORS
+# ============================================================================
+
+class _CompiledPredictorMixin:
+    """
+    Keeps compiled predictors (Treelite library, ONNX Runtime session) out of the pickle;
+    they are rebuilt on save and reopened from the files next to the pickle on load.
+    Also holds the explanation caches shared by both models.
+    """
+    
+    # Pickles saved before compiled predictors lack the attributes
+    _tl_predictor = None
+    _session = None
+    _global_top_features = None
+    _shap_cache = None
+    _probe = None
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attr in ('_tl_predictor', '_session', '_shap_cache'):
+            state.pop(attr, None)
+        return state
+    
+    def _explain(self, features: np.ndarray, detailed: bool, shap_importance) -> List[Tuple[str, float]]:
+        """
+        Top 5 features behind a prediction.
+        
+        By default the model's global feature importances (computed once per model).
+        With `detailed`, per-question SHAP importances from `shap_importance(X)`,
+        memoized on the rounded model input; models without a SHAP explainer
+        (SHAP not installed, or pickles saved without one) fall back to the global ones.
+        """
+        if detailed and self.shap_explainer is not None:
+            X = _model_input(self, features)
+            key = tuple(np.round(X[0], SHAP_CACHE_DECIMALS).tolist())
+            if self._shap_cache is None:
+                self._shap_cache = LRUCache(maxsize=SHAP_CACHE_SIZE)
+            top_features = self._shap_cache.get(key)
+            if top_features is None:
+                top_features = _rank_features(self.feature_names, shap_importance(X))
+                self._shap_cache.put(key, top_features)
+            return top_features
+        
+        # Set at training; pickles from before then rank on first use
+        if self._global_top_features is None:
+            importances = [float(v) for v in self.model.feature_importances_]
+            self._global_top_features = _rank_features(self.feature_names, importances)
+        return self._global_top_features
+    
+    def _save(self, path: str):
+        _dump_atomic(self, path)
+        _export_treelite(self.model, _treelite_path(path))
+        _export_onnx(self.model, _onnx_path(path))
+        self._attach_predictors(path)
+    
+    def _attach_predictors(self, path: str):
+        """
+        Open the fastest available compiled predictor: Treelite, then ONNX Runtime.
+        Each must reproduce the estimator on the probe rows stored at training
+        (pickles from before then get a few constant rows) before it is used.
+        """
+        pickle_mtime = Path(path).stat().st_mtime
+        # A file older than the pickle belongs to a previous training run
+        def fresh(p):
+            return p.exists() and p.stat().st_mtime >= pickle_mtime
+        
+        n_features = self.model.n_features_in_
+        probe = self._probe
+        if probe is None:
+            probe = np.outer([0, 1, 10, 100], np.ones(n_features)).astype(np.float32)
+        expected = self._estimator_output(probe)
+        
+        self._tl_predictor = self._session = None
+        if fresh(_treelite_path(path)):
+            self._tl_predictor = _load_treelite_predictor(_treelite_path(path))
+            if self._tl_predictor is not None and not self._matches(probe, expected):
+                self._tl_predictor = None
+        if self._tl_predictor is None and fresh(_onnx_path(path)):
+            self._session = _load_onnx_session(_onnx_path(path))
+            if self._session is not None and not self._matches(probe, expected):
+                self._session = None
+    
+    def _matches(self, probe: np.ndarray, expected: np.ndarray) -> bool:
+        output = self._predict_output(probe)
+        return output.shape == expected.shape and np.allclose(output, expected, rtol=PROBE_RTOL, atol=PROBE_ATOL)
+    
+    def _estimator_output(self, X: np.ndarray) -> np.ndarray:
+        """Class probabilities (classifier) or scores (regressor) from the sklearn/XGBoost estimator."""
+        if hasattr(self.model, 'predict_proba'):
+            return self.model.predict_proba(X)
+        return self.model.predict(X)
+    
+    def _predict_output(self, X: np.ndarray) -> np.ndarray:
+        """Same as _estimator_output, from a compiled predictor when one is loaded."""
+        if self._tl_predictor is not None:
+            output = _run_treelite(self._tl_predictor, X)
+        elif self._session is not None:
+            # Classifiers output (label, probabilities), regressors just the scores
+            output = self._session.run(None, {'X': X})[-1]
+        else:
+            return self._estimator_output(X)
+        return output if hasattr(self.model, 'predict_proba') else output.ravel()
+    
+    @staticmethod
+    def _load(path: str):
+        try:
+            # NumPy arrays are mapped read-only from the file instead of copied,
+            # so processes loading the same model share those pages
+            obj = joblib.load(path, mmap_mode='r')
+        except AttributeError:
+            # Plain pickles saved by `python models.py` reference __main__ classes
+            with open(path, 'rb') as f:
+                obj = _RenamingUnpickler(f).load()
+        obj._attach_predictors(path)
+        return obj
+
+
+# ============================================================================
+# EMBEDDING PCA
+# ============================================================================
+
+def reduce_embeddings(pca: IncrementalPCA, embeddings: np.ndarray) -> np.ndarray:
+    """
+    PCA components of SBERT embeddings (one row per question), as float32.
+    Embeddings are rounded to float16 first, the precision training stores them
+    at, so training and inference feed the PCA identical values.
+    """
+    X = np.asarray(embeddings, dtype=np.float16).astype(np.float32)
+    return pca.transform(X).astype(np.float32, copy=False)
+
+
+def model_features(features: np.ndarray, embeddings: np.ndarray, pca: IncrementalPCA) -> np.ndarray:
+    """
+    Model input for a feature vector (or row-stacked matrix) and its SBERT embedding(s):
+    the extracted features followed by the PCA-reduced embedding, in MODEL_FEATURE_NAMES order.
+    """
+    features = np.atleast_2d(features)
+    return np.hstack([features, reduce_embeddings(pca, np.atleast_2d(embeddings))])
+
+
+def save_embedding_pca(pca: IncrementalPCA, path: str = None):
+    """Save the embedding PCA fitted at training; the models are useless without it."""
+    _dump_atomic(pca, path or str(EMBEDDING_PCA_PATH))
+
+
+def load_embedding_pca(path: str = None) -> IncrementalPCA:
+    """Load the embedding PCA saved with the models."""
+    return joblib.load(path or str(EMBEDDING_PCA_PATH))
 
 
 # ============================================================================
 # TRAINING DATA LOADER
 # ============================================================================
 
-def load_training_data(csv_path: str) -> Tuple[pd.DataFrame, List[str], List[float]]:
+def load_training_data(csv_path: str, n_jobs: int = 1) -> Tuple[pd.DataFrame, List[str], List[float]]:
     """
     Load training data from CSV.
     
@@ -71,36 +549,56 @@ def load_training_data(csv_path: str) -> Tuple[pd.DataFrame, List[str], List[flo
     "What is photosynthesis?",Easy,75
     "Analyze the economic policies...",Hard,85
     
+    Args:
+    - csv_path: Path to training data CSV
+    - n_jobs: Processes for text feature extraction (-1 = all cores)
+    
     Returns:
     - features_df: DataFrame with all extracted features
     - difficulties: List of difficulty labels
     - quality_scores: List of quality scores (0-100)
+    - embeddings: float16 SBERT embeddings, memory-mapped from a temporary file
+    - pca: IncrementalPCA fitted on the embeddings
     """
-    df = pd.read_csv(csv_path)
-    
-    # Extract features for all questions
-    feature_dicts = []
-    embeddings = []
+    # Labels are small; reading them first also gives the row count to preallocate
+    labels = pd.read_csv(csv_path, usecols=['difficulty', 'quality_score'])
+    n_rows = len(labels)
     
-    for question in df['question'].values:
-        features, embedding = extract_all_features(question)
-        feature_dicts.append(features)
-        embeddings.append(embedding)
+    # Extract features chunk by chunk into one preallocated matrix, one batched
+    # SBERT pass per chunk. Embeddings are kept as float16 on disk, not in RAM.
+    features_matrix = np.empty((n_rows, len(FEATURE_NAMES)), dtype=np.float32)
+    embeddings = None
+    start = 0
+    for chunk in pd.read_csv(csv_path, usecols=['question'], chunksize=TRAINING_CSV_CHUNK_SIZE):
+        end = start + len(chunk)
+        chunk_features, chunk_embeddings = extract_all_features_batch(chunk['question'].tolist(), n_jobs=n_jobs)
+        if embeddings is None:
+            # The mapping outlives the (already unlinked) temporary file
+            with tempfile.TemporaryFile() as f:
+                embeddings = np.memmap(f, dtype=np.float16, mode='w+', shape=(n_rows, chunk_embeddings.shape[1]))
+        features_matrix[start:end] = chunk_features
+        embeddings[start:end] = chunk_embeddings
+        start = end
     
     # Create feature DataFrame
-    features_df = pd.DataFrame(feature_dicts)
+    features_df = _feature_frame(features_matrix)
     
-    # Add PCA-reduced embeddings (use top components)
-    from sklearn.decomposition import PCA
-    pca = PCA(n_components=8)
-    embedding_reduced = pca.fit_transform(np.array(embeddings))
-    
-    for i in range(8):
-        features_df[f'embedding_pca_{i}'] = embedding_reduced[:, i]
+    # Add PCA-reduced embeddings (use top components), fitted batch by batch.
+    # Equal-sized batches of at least PCA_BATCH_SIZE rows (or all rows), so no
+    # short tail batch has fewer rows than components.
+    bounds = np.linspace(0, n_rows, max(n_rows // PCA_BATCH_SIZE, 1) + 1).astype(int)
+    batches = list(zip(bounds[:-1], bounds[1:]))
+    pca = IncrementalPCA(n_components=EMBEDDING_PCA_COMPONENTS, batch_size=PCA_BATCH_SIZE)
+    for lo, hi in batches:
+        pca.partial_fit(embeddings[lo:hi].astype(np.float32))
+    embedding_reduced = np.empty((n_rows, EMBEDDING_PCA_COMPONENTS), dtype=np.float32)
+    for lo, hi in batches:
+        embedding_reduced[lo:hi] = reduce_embeddings(pca, embeddings[lo:hi])
+    features_df[EMBEDDING_PCA_NAMES] = embedding_reduced
     
     # Get labels and quality scores
-    difficulties = df['difficulty'].values.tolist()
-    quality_scores = df['quality_score'].values.astype(float).tolist()
+    difficulties = labels['difficulty'].values.tolist()
+    quality_scores = labels['quality_score'].values.astype(float).tolist()
     
     return features_df, difficulties, quality_scores, embeddings, pca
 
@@ -109,32 +607,38 @@ def load_training_data(csv_path: str) -> Tuple[pd.DataFrame, List[str], List[flo
 # DIFFICULTY CLASSIFICATION
 # ============================================================================
 
-class DifficultyClassifier:
+class DifficultyClassifier(_CompiledPredictorMixin):
     """Train and predict question difficulty."""
     
+    # Trees are scale-invariant, so new models train on raw features. Pickles
+    # saved before that lack the attribute and fall back to this class default.
+    _apply_scaler = True
+    
     def __init__(self):
         self.model = None
-        self.scaler = StandardScaler()
+        self.scaler = None
+        self._apply_scaler = False
         self.label_encoder = LabelEncoder()
-        self.feature_names = get_feature_names() + [f'embedding_pca_{i}' for i in range(8)]
+        self.feature_names = list(MODEL_FEATURE_NAMES)
         self.shap_explainer = None
     
-    def train(self, X: pd.DataFrame, y: List[str]) -> Dict:
+    def train(self, X: pd.DataFrame, y: List[str], do_cv: bool = False) -> Dict:
         """
         Train difficulty classification model.
         
         Args:
         - X: Feature DataFrame
         - y: List of difficulty labels (Easy, Medium, Hard)
+        - do_cv: Also run 5-fold cross-validation (5 extra fits, run in parallel)
         
         Returns:
-        - metrics: Dict with accuracy, f1_score, cross_val_score
+        - metrics: Dict with accuracy, f1_score, cross_val_score (None without do_cv)
         """
         # Encode labels
         y_encoded = self.label_encoder.fit_transform(y)
         
-        # Scale features
-        X_scaled = self.scaler.fit_transform(X)
+        # Tree splits are thresholds, so features are used unscaled
+        X_train = np.asarray(X, dtype=np.float32)
         
         # Train model
         if HAS_XGBOOST:
@@ -146,35 +650,45 @@ class DifficultyClassifier:
                 eval_metric='mlogloss'
             )
         else:
-            self.model = RandomForestClassifier(
-                n_estimators=100,
+            # All features are numeric, so no categorical handling
+            self.model = HistGradientBoostingClassifier(
+                max_iter=200,
                 max_depth=8,
-                random_state=42,
-                n_jobs=-1
+                learning_rate=0.05,
+                max_leaf_nodes=HGB_MAX_LEAF_NODES,
+                min_samples_leaf=_hgb_min_samples_leaf(len(X_train)),
+                l2_regularization=HGB_L2_REGULARIZATION,
+                early_stopping='auto',
+                validation_fraction=0.1,
+                categorical_features=None,
+                random_state=42
             )
         
-        self.model.fit(X_scaled, y_encoded)
+        self.model.fit(X_train, y_encoded)
         
         # Compute metrics
-        y_pred = self.model.predict(X_scaled)
+        y_pred = self.model.predict(X_train)
         accuracy = accuracy_score(y_encoded, y_pred)
         f1 = f1_score(y_encoded, y_pred, average='weighted', zero_division=0)
         
         # Cross-validation
-        cv_scores = cross_val_score(self.model, X_scaled, y_encoded, cv=5, scoring='accuracy')
+        cv_mean, cv_std = _cross_validate(self.model, X_train, y_encoded, 'accuracy') if do_cv else (None, None)
         
-        # Setup SHAP explainer
-        if HAS_SHAP and not isinstance(self.model, xgb.XGBClassifier):
-            self.shap_explainer = shap.TreeExplainer(self.model)
+        # Setup SHAP explainer (tree_path_dependent needs no background data)
+        self.shap_explainer = _tree_explainer(self.model)
+        self._probe = _probe_rows(self.model, X_train)
+        self._global_top_features = _rank_features(
+            self.feature_names, _global_importances(self.model, X_train, y_encoded)
+        )
         
         return {
             'accuracy': float(accuracy),
             'f1_score': float(f1),
-            'cv_mean': float(cv_scores.mean()),
-            'cv_std': float(cv_scores.std()),
+            'cv_mean': cv_mean,
+            'cv_std': cv_std,
         }
     
-    def predict(self, features: Dict) -> Tuple[str, float]:
+    def predict(self, features: np.ndarray) -> Tuple[str, float]:
         """
         Predict difficulty and confidence.
         
@@ -185,212 +699,255 @@ class DifficultyClassifier:
         if self.model is None:
             raise ValueError("Model not trained yet")
         
-        # Convert dict to DataFrame
-        X = pd.DataFrame([features])
-        X_scaled = self.scaler.transform(X)
+        X = _model_input(self, features)
         
-        # Predict
-        pred_encoded = self.model.predict(X_scaled)[0]
-        probabilities = self.model.predict_proba(X_scaled)[0]
-        confidence = float(np.max(probabilities))
+        # Predict (the predicted class is the argmax of the probabilities)
+        probabilities = self._predict_proba(X)[0]
+        best = int(np.argmax(probabilities))
+        pred_encoded = self.model.classes_[best]
+        confidence = float(probabilities[best])
         
         difficulty = self.label_encoder.inverse_transform([pred_encoded])[0]
         
         return difficulty, confidence
     
-    def explain(self, features: Dict) -> List[Tuple[str, float]]:
+    def predict_batch(self, features: np.ndarray) -> List[Tuple[str, float]]:
         """
-        Get SHAP feature importance for a prediction.
+        Predict difficulty and confidence for a feature matrix (one row per question) in one model call.
         
         Returns:
-        - List of (feature_name, importance_value) tuples, sorted by importance
+        - List of (difficulty, confidence) tuples
         """
-        if self.shap_explainer is None:
-            return []
+        if self.model is None:
+            raise ValueError("Model not trained yet")
         
-        X = pd.DataFrame([features])
-        X_scaled = self.scaler.transform(X)
+        X = _model_input(self, features)
         
-        shap_values = self.shap_explainer.shap_values(X_scaled)
+        # predict() is the argmax of predict_proba(), so one call gives both
+        probabilities = self._predict_proba(X)
+        best = np.argmax(probabilities, axis=1)
+        pred_encoded = np.asarray(self.model.classes_)[best]
+        confidences = probabilities[np.arange(len(best)), best]
+        
+        difficulties = self.label_encoder.inverse_transform(pred_encoded)
+        
+        return [(d, float(c)) for d, c in zip(difficulties, confidences)]
+    
+    def explain(self, features: np.ndarray, detailed: bool = False) -> List[Tuple[str, float]]:
+        """
+        Get feature importance for a prediction: global by default, per-question SHAP if `detailed`.
+        
+        Returns:
+        - List of (feature_name, importance_value) tuples, sorted by importance
+        """
+        return self._explain(features, detailed, self._shap_importance)
+    
+    def _shap_importance(self, X: np.ndarray) -> np.ndarray:
+        """Absolute SHAP values of the first row of X."""
+        shap_values = self.shap_explainer.shap_values(X)
         
         # Get mean absolute SHAP values
         if isinstance(shap_values, list):  # Multi-class
             shap_values = shap_values[0]
+        elif shap_values.ndim == 3:  # Multi-class, newer SHAP: (rows, features, classes)
+            shap_values = shap_values[..., 0]
         
-        mean_abs_shap = np.abs(shap_values[0])
-        
-        # Rank features
-        feature_importance = list(zip(self.feature_names, mean_abs_shap))
-        feature_importance.sort(key=lambda x: x[1], reverse=True)
-        
-        return feature_importance[:5]  # Top 5 features
+        return np.abs(shap_values[0])
+    
+    def _predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Class probabilities, from a compiled predictor when one is loaded."""
+        return self._predict_output(X)
     
     def save(self, path: str = None):
-        """Save model to disk."""
-        path = path or str(DIFFICULTY_MODEL_PATH)
-        with open(path, 'wb') as f:
-            pickle.dump(self, f)
+        """Save model to disk (plus compiled Treelite/ONNX copies when the tools are installed)."""
+        self._save(path or str(DIFFICULTY_MODEL_PATH))
     
     @staticmethod
     def load(path: str = None):
-        """Load model from disk."""
-        path = path or str(DIFFICULTY_MODEL_PATH)
-        with open(path, 'rb') as f:
-            return _RenamingUnpickler(f).load()
+        """Load model from disk, serving predictions through a compiled copy if one exists."""
+        return _CompiledPredictorMixin._load(path or str(DIFFICULTY_MODEL_PATH))
 
 
 # ============================================================================
 # QUALITY SCORE REGRESSION
 # ============================================================================
 
-class QualityRegressor:
+class QualityRegressor(_CompiledPredictorMixin):
     """Train and predict question quality score (0-100)."""
     
+    # Trees are scale-invariant, so new models train on raw features. Pickles
+    # saved before that lack the attribute and fall back to this class default.
+    _apply_scaler = True
+    
     def __init__(self):
         self.model = None
-        self.scaler = StandardScaler()
-        self.feature_names = get_feature_names() + [f'embedding_pca_{i}' for i in range(8)]
+        self.scaler = None
+        self._apply_scaler = False
+        self.feature_names = list(MODEL_FEATURE_NAMES)
         self.shap_explainer = None
     
-    def train(self, X: pd.DataFrame, y: List[float]) -> Dict:
+    def train(self, X: pd.DataFrame, y: List[float], do_cv: bool = False) -> Dict:
         """
         Train quality score regression model.
         
         Args:
         - X: Feature DataFrame
         - y: List of quality scores (0-100)
+        - do_cv: Also run 5-fold cross-validation (5 extra fits, run in parallel)
         
         Returns:
-        - metrics: Dict with MAE, R2, RMSE
+        - metrics: Dict with MAE, R2, RMSE, cross-validated R2 (None without do_cv)
         """
-        # Scale features
-        X_scaled = self.scaler.fit_transform(X)
-        
-        # Train model
-        self.model = RandomForestRegressor(
-            n_estimators=100,
-            max_depth=10,
-            random_state=42,
-            n_jobs=-1
+        # Tree splits are thresholds, so features are used unscaled
+        X_train = np.asarray(X, dtype=np.float32)
+        
+        # Train model (all features are numeric, so no categorical handling)
+        self.model = HistGradientBoostingRegressor(
+            max_iter=200,
+            max_depth=8,
+            learning_rate=0.05,
+            max_leaf_nodes=HGB_MAX_LEAF_NODES,
+            min_samples_leaf=_hgb_min_samples_leaf(len(X_train)),
+            l2_regularization=HGB_L2_REGULARIZATION,
+            early_stopping='auto',
+            validation_fraction=0.1,
+            categorical_features=None,
+            random_state=42
         )
         
-        self.model.fit(X_scaled, y)
+        self.model.fit(X_train, y)
         
         # Compute metrics
-        y_pred = self.model.predict(X_scaled)
+        y_pred = self.model.predict(X_train)
         mae = mean_absolute_error(y, y_pred)
         r2 = r2_score(y, y_pred)
         rmse = np.sqrt(np.mean((y - y_pred) ** 2))
         
         # Cross-validation
-        cv_scores = cross_val_score(self.model, X_scaled, y, cv=5, scoring='r2')
+        cv_mean, cv_std = _cross_validate(self.model, X_train, y, 'r2') if do_cv else (None, None)
         
-        # Setup SHAP explainer
-        if HAS_SHAP:
-            self.shap_explainer = shap.TreeExplainer(self.model)
+        # Setup SHAP explainer (tree_path_dependent needs no background data)
+        self.shap_explainer = _tree_explainer(self.model)
+        self._probe = _probe_rows(self.model, X_train)
+        self._global_top_features = _rank_features(
+            self.feature_names, _global_importances(self.model, X_train, y)
+        )
         
         return {
             'mae': float(mae),
             'rmse': float(rmse),
             'r2': float(r2),
-            'cv_mean': float(cv_scores.mean()),
-            'cv_std': float(cv_scores.std()),
+            'cv_mean': cv_mean,
+            'cv_std': cv_std,
         }
     
-    def predict(self, features: Dict) -> float:
+    def predict(self, features: np.ndarray) -> float:
         """
         Predict quality score (0-100).
         """
         if self.model is None:
             raise ValueError("Model not trained yet")
         
-        # Convert dict to DataFrame
-        X = pd.DataFrame([features])
-        X_scaled = self.scaler.transform(X)
+        X = _model_input(self, features)
         
         # Predict and clamp to [0, 100]
-        score = float(self.model.predict(X_scaled)[0])
+        score = float(self._predict_scores(X)[0])
         return max(0, min(100, score))
     
-    def explain(self, features: Dict) -> List[Tuple[str, float]]:
+    def predict_batch(self, features: np.ndarray) -> List[float]:
         """
-        Get SHAP feature importance for a prediction.
+        Predict quality scores (0-100) for a feature matrix (one row per question) in one model call.
         """
-        if self.shap_explainer is None:
-            return []
-        
-        X = pd.DataFrame([features])
-        X_scaled = self.scaler.transform(X)
-        
-        shap_values = self.shap_explainer.shap_values(X_scaled)[0]
-        mean_abs_shap = np.abs(shap_values)
+        if self.model is None:
+            raise ValueError("Model not trained yet")
         
-        # Rank features
-        feature_importance = list(zip(self.feature_names, mean_abs_shap))
-        feature_importance.sort(key=lambda x: x[1], reverse=True)
+        X = _model_input(self, features)
         
-        return feature_importance[:5]  # Top 5 features
+        scores = np.clip(self._predict_scores(X), 0, 100)
+        return [float(score) for score in scores]
+    
+    def explain(self, features: np.ndarray, detailed: bool = False) -> List[Tuple[str, float]]:
+        """
+        Get feature importance for a prediction: global by default, per-question SHAP if `detailed`.
+        """
+        return self._explain(features, detailed, self._shap_importance)
+    
+    def _shap_importance(self, X: np.ndarray) -> np.ndarray:
+        """Absolute SHAP values of the first row of X."""
+        return np.abs(self.shap_explainer.shap_values(X)[0])
+    
+    def _predict_scores(self, X: np.ndarray) -> np.ndarray:
+        """Raw (unclamped) quality scores, from a compiled predictor when one is loaded."""
+        return self._predict_output(X)
     
     def save(self, path: str = None):
-        """Save model to disk."""
-        path = path or str(QUALITY_MODEL_PATH)
-        with open(path, 'wb') as f:
-            pickle.dump(self, f)
+        """Save model to disk (plus compiled Treelite/ONNX copies when the tools are installed)."""
+        self._save(path or str(QUALITY_MODEL_PATH))
     
     @staticmethod
     def load(path: str = None):
-        """Load model from disk."""
-        path = path or str(QUALITY_MODEL_PATH)
-        with open(path, 'rb') as f:
-            return _RenamingUnpickler(f).load()
+        """Load model from disk, serving predictions through a compiled copy if one exists."""
+        return _CompiledPredictorMixin._load(path or str(QUALITY_MODEL_PATH))
 
 
 # ============================================================================
 # FULL PIPELINE
 # ============================================================================
 
-def train_models(csv_path: str) -> Dict:
+def _format_metric(value) -> str:
+    return 'skipped' if value is None else f"{value:.4f}"
+
+
+def train_models(csv_path: str, n_jobs: int = 1, cv: bool = False) -> Dict:
     """
     Train both difficulty and quality models.
     
     Args:
     - csv_path: Path to training data CSV
+    - n_jobs: Processes for feature extraction (-1 = all cores)
+    - cv: Also report 5-fold cross-validation scores (slower)
     
     Returns:
     - metrics: Dict with all training metrics
     """
     print("Loading training data...")
-    X, difficulties, quality_scores, embeddings, pca = load_training_data(csv_path)
+    X, difficulties, quality_scores, embeddings, pca = load_training_data(csv_path, n_jobs=n_jobs)
     
     print("\nTraining difficulty classifier...")
     difficulty_clf = DifficultyClassifier()
-    difficulty_metrics = difficulty_clf.train(X, difficulties)
+    difficulty_metrics = difficulty_clf.train(X, difficulties, do_cv=cv)
     difficulty_clf.save()
     
     print("\nTraining quality regressor...")
     quality_reg = QualityRegressor()
-    quality_metrics = quality_reg.train(X, quality_scores)
+    quality_metrics = quality_reg.train(X, quality_scores, do_cv=cv)
     quality_reg.save()
     
+    # Inference reduces each question's embedding with the same fitted PCA
+    save_embedding_pca(pca)
+    
     # Save metadata
     metadata = {
-        'feature_names': get_feature_names() + [f'embedding_pca_{i}' for i in range(8)],
+        'feature_names': MODEL_FEATURE_NAMES,
         'difficulty_metrics': difficulty_metrics,
         'quality_metrics': quality_metrics,
         'num_training_samples': len(X),
     }
     
-    with open(METADATA_PATH, 'w') as f:
-        json.dump(metadata, f, indent=2)
+    if HAS_ORJSON:
+        METADATA_PATH.write_bytes(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+    else:
+        with open(METADATA_PATH, 'w') as f:
+            json.dump(metadata, f, indent=2)
     
     print("\n" + "=" * 50)
     print("DIFFICULTY CLASSIFIER METRICS:")
     for key, value in difficulty_metrics.items():
-        print(f"  {key}: {value:.4f}")
+        print(f"  {key}: {_format_metric(value)}")
     
     print("\nQUALITY REGRESSOR METRICS:")
     for key, value in quality_metrics.items():
-        print(f"  {key}: {value:.4f}")
+        print(f"  {key}: {_format_metric(value)}")
     print("=" * 50)
     
     return {
@@ -405,9 +962,12 @@ if __name__ == '__main__':
     
     if len(sys.argv) > 1:
         csv_path = sys.argv[1]
-        metrics = train_models(csv_path)
+        # Train through the imported module so the saved models reference
+        # models.* classes, not __main__.* (joblib files cannot be renamed on load)
+        from models import train_models
+        metrics = train_models(csv_path, cv='--cv' in sys.argv[2:])
     else:
-        print("Usage: python models.py <path_to_training_data.csv>")
+        print("Usage: python models.py <path_to_training_data.csv> [--cv]")
         print("\nExpected CSV format:")
         print("question,difficulty,quality_score")
         print('"What is photosynthesis?",Easy,75')